@@ -0,0 +1,375 @@
+"""Offline benchmark suite for the product grid generator.
+
+Builds synthetic catalogs (CSV + local image folder), serves "web" images
+from a local HTTP server instead of Google, and times each pipeline stage
+in a fresh child process. Memory is reported as the peak RSS increase over
+a baseline taken once the CSV, fonts and products are loaded.
+
+    python benchmark_grid_generator.py --rows 100,1000,10000 --report bench.json
+"""
+
+from PIL import Image, ImageDraw
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from product_grid_generator import PAGE_FORMATS, PAGE_SIZES, ProductGridGenerator, save_page_image
+
+STAGES = ["find_local_image", "split_text_to_fit", "draw_product_cell",
+          "create_grid_page", "page_save", "process_product_images"]
+
+WORDS = ["Organic", "Whole", "Milk", "Greek", "Yogurt", "Strawberry", "Vanilla", "Family", "Size",
+         "Sparkling", "Water", "Lime", "Chocolate", "Chip", "Cookies", "Extra", "Crunchy", "Peanut",
+         "Butter", "Low", "Sodium", "Chicken", "Broth", "Frozen", "Pepperoni", "Pizza", "Classic"]
+
+
+def _proc_status_mb(field):
+    """A VmRSS/VmHWM value from /proc/self/status in MB, or None off Linux"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    """Resident set size of the current process in MB (None where unsupported)"""
+    return _proc_status_mb("VmRSS")
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking from the current RSS; returns False where the kernel does not allow it"""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (None where unsupported)"""
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_name(rng, index):
+    """Product name of 3-14 words so wrapping sees short and very long names"""
+    words = rng.sample(WORDS, rng.randint(3, 14))
+    return f"{' '.join(words)} {index}"
+
+
+def make_source_images(folder, count, rng):
+    """Pool of distinct images in varied sizes and formats"""
+    formats = [(".jpg", "JPEG"), (".png", "PNG"), (".webp", "WEBP")]
+    paths = []
+    for i in range(count):
+        width, height = rng.choice([(400, 400), (800, 800), (1200, 900), (2400, 2400), (3000, 2000)])
+        img = Image.new("RGB", (width, height), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, y0 = rng.randrange(width), rng.randrange(height)
+            draw.ellipse([x0, y0, x0 + width // 4, y0 + height // 4],
+                         fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        ext, fmt = formats[i % len(formats)]
+        path = os.path.join(folder, f"source_{i}{ext}")
+        img.save(path, fmt)
+        paths.append(path)
+    return paths
+
+
+def build_fixture(root, rows, duplicate_ratio=0.2, missing_ratio=0.1, source_images=60, seed=7):
+    """Write catalog.csv and an image folder under root; returns the CSV path"""
+    rng = random.Random(seed)
+    shutil.rmtree(root, ignore_errors=True)
+    image_folder = os.path.join(root, "image")
+    source_folder = os.path.join(root, "sources")
+    os.makedirs(image_folder)
+    os.makedirs(os.path.join(root, "output"))
+    os.makedirs(source_folder)
+    sources = make_source_images(source_folder, source_images, rng)
+
+    unique_count = max(1, int(rows * (1 - duplicate_ratio)))
+    names = [synthetic_name(rng, i) for i in range(unique_count)]
+
+    for name in names:
+        if rng.random() < missing_ratio:
+            continue
+        source = rng.choice(sources)
+        # Only .jpg files are drawn by the renderer; other formats exercise the lookup
+        ext = ".jpg" if source.endswith(".jpg") or rng.random() < 0.5 else os.path.splitext(source)[1]
+        target = os.path.join(image_folder, name + ext)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    csv_path = os.path.join(root, "catalog.csv")
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("Product Name,Quantity,For,Price\n")
+        for i in range(rows):
+            name = names[i] if i < unique_count else rng.choice(names)
+            quantity = rng.choice(["", "12 oz", "6 pk", "1 lb"])
+            for_value = rng.choice(["", "1", "2", "3"])
+            f.write(f'"{name}",{quantity},{for_value},${rng.randint(1, 19)}.{rng.randint(0, 99):02d}\n')
+    return csv_path
+
+
+class _StubImageHandler(BaseHTTPRequestHandler):
+    """Serves a fake image search page and JPEG bodies"""
+    image_bytes = b""
+
+    def do_GET(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        if parsed.path == "/search":
+            query = urllib.parse.parse_qs(parsed.query).get("q", [""])[0]
+            token = abs(hash(query)) % 1000
+            host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            body = f'<html><body><img src="{host}/img/{token}.jpg"></body></html>'.encode("utf-8")
+            content_type = "text/html"
+        elif parsed.path.startswith("/img/"):
+            body = self.image_bytes
+            content_type = "image/jpeg"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """Start the local image server on a free port; returns (server, search_url_template)"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (1000, 1000), (180, 60, 60)).save(buffer, "JPEG", quality=90)
+    _StubImageHandler.image_bytes = buffer.getvalue()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/search?q={{query}}"
+
+
+def _make_generator(root, config):
+    generator = ProductGridGenerator(project_folder=root)
+    generator.font_path = config.get("font")
+    generator.search_url_template = config["search_url_template"]
+    generator.host_min_interval = config["host_interval"]
+    generator.download_workers = config["download_workers"]
+    generator.configure_layout(config["dpi"], config["columns"], config["rows"], config["page_size"],
+                               config["draft"])
+    generator.page_format = config["format"]
+    generator.use_thumbnail_cache = False
+    generator.use_lookup_cache = False
+    return generator
+
+
+def _latency_summary(samples):
+    """Count, total and per-call percentiles in milliseconds"""
+    samples = sorted(samples)
+    if not samples:
+        return {"calls": 0}
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+    return {"calls": len(samples), "total_s": round(sum(samples), 4),
+            "p50_ms": round(pick(0.5), 3), "p95_ms": round(pick(0.95), 3), "max_ms": round(samples[-1] * 1000, 3)}
+
+
+def run_stage(stage, root, csv_path, config, queue):
+    """Child process body: time one stage and report its metrics through queue"""
+    import contextlib
+    import gc
+    import pandas as pd
+
+    generator = _make_generator(root, config)
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.setup_directories()
+        df = pd.read_csv(csv_path)
+        fonts = generator.load_fonts()
+    header_font, product_font, price_font, header_attr_font = fonts
+    names = list(df["Product Name"].drop_duplicates())
+    products = generator.prepare_products(df.drop_duplicates(subset=["Product Name"]))
+    cell_width, cell_height = generator.cell_size()
+    cells_per_page = generator.layout.cells_per_page
+    samples = []
+    items = 0
+
+    # Setup memory (pandas, the CSV, prepared products) is the baseline, not part of the stage
+    gc.collect()
+    baseline_rss = current_rss_mb()
+    peak_reset = reset_peak_rss()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == "find_local_image":
+            for name in names[:config["max_items"]]:
+                t = time.perf_counter()
+                generator.find_local_image(name)
+                samples.append(time.perf_counter() - t)
+        elif stage == "split_text_to_fit":
+            draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+            for name in names[:config["max_items"]]:
+                t = time.perf_counter()
+                generator.split_text_to_fit(draw, name, product_font, generator.layout.name_width)
+                samples.append(time.perf_counter() - t)
+        elif stage == "draw_product_cell":
+            canvas = Image.new("RGB", (generator.layout.width, generator.layout.height), (255, 255, 255))
+            draw = ImageDraw.Draw(canvas)
+            for idx, product in enumerate(products[:config["max_items"]]):
+                x, y = generator.cell_origin(idx % cells_per_page, cell_width, cell_height)
+                t = time.perf_counter()
+                generator.draw_product_cell(draw, canvas, x, y, product, product_font, price_font,
+                                            cell_width, cell_height)
+                samples.append(time.perf_counter() - t)
+        elif stage == "create_grid_page":
+            run_stamp = time.strftime("%Y%m%d_%H%M%S")
+            for page_number in range(1, config["max_pages"] + 1):
+                batch = products[(page_number - 1) * cells_per_page:page_number * cells_per_page]
+                if not batch:
+                    break
+                t = time.perf_counter()
+                generator.create_grid_page(page_number, batch, fonts, run_stamp)
+                samples.append(time.perf_counter() - t)
+        elif stage == "page_save":
+            canvas = generator.get_page_template(fonts).copy()
+            for _ in range(config["save_repeats"]):
+                t = time.perf_counter()
+                save_page_image(canvas, io.BytesIO(), generator.page_format, dpi=generator.layout.dpi)
+                samples.append(time.perf_counter() - t)
+        elif stage == "process_product_images":
+            generator.process_product_images(df)
+            items = len(df)
+    elapsed = time.perf_counter() - start
+
+    items = items or len(samples)
+    peak_rss = peak_rss_mb()
+    rss_increase = None
+    if peak_rss is not None and baseline_rss is not None:
+        # Without a peak reset the lifetime peak may predate the stage, so this is only a lower bound
+        rss_increase = round(max(0.0, peak_rss - baseline_rss), 1)
+    result = {"stage": stage, "elapsed_s": round(elapsed, 4), "items": items,
+              "throughput_per_s": round(items / elapsed, 2) if elapsed else None,
+              "latency": _latency_summary(samples), "baseline_rss_mb": baseline_rss,
+              "rss_increase_mb": rss_increase, "rss_increase_exact": peak_reset}
+    queue.put(result)
+
+
+def benchmark_catalog(rows, workdir, config, stages):
+    """Build one synthetic catalog and time every requested stage in its own process"""
+    root = os.path.join(workdir, f"catalog_{rows}")
+    t = time.perf_counter()
+    csv_path = build_fixture(root, rows, config["duplicate_ratio"], config["missing_ratio"])
+    print(f"✓ Built {rows}-row fixture in {time.perf_counter() - t:.1f}s")
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    # process_product_images downloads into the image folder, so it always runs last
+    for stage in sorted(stages, key=lambda name: name == "process_product_images"):
+        queue = context.Queue()
+        process = context.Process(target=run_stage, args=(stage, root, csv_path, config, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        result["rows"] = rows
+        results.append(result)
+        latency = result["latency"]
+        print(f"  {stage:<24} {result['elapsed_s']:>9.3f}s  {result['throughput_per_s'] or 0:>10.1f}/s"
+              f"  p50 {latency.get('p50_ms', 0):>9.3f}ms  p95 {latency.get('p95_ms', 0):>9.3f}ms"
+              f"  rss +{result['rss_increase_mb'] or 0:>7.1f}MB")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the product grid generator on synthetic catalogs.")
+    parser.add_argument("--rows", default="100,1000,10000",
+                        help="comma-separated catalog sizes (e.g. 100,1000,10000,100000)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    parser.add_argument("--workdir", help="where fixtures are written (default: a temporary folder)")
+    parser.add_argument("--report", default="bench_results.json", help="JSON report path")
+    parser.add_argument("--font", help="font file used for rendering (default: first font found)")
+    parser.add_argument("--max-items", type=int, default=500, help="cap on per-item stage calls")
+    parser.add_argument("--max-pages", type=int, default=5, help="pages rendered by create_grid_page")
+    parser.add_argument("--save-repeats", type=int, default=3, help="page encodes timed by page_save")
+    parser.add_argument("--format", choices=sorted(PAGE_FORMATS), default="jpeg", help="page output format")
+    parser.add_argument("--page-size", choices=sorted(PAGE_SIZES), default="a3", help="page size")
+    parser.add_argument("--columns", type=int, default=3, help="grid columns")
+    parser.add_argument("--rows-per-page", type=int, default=4, help="grid rows")
+    parser.add_argument("--dpi", type=int, help="render resolution (default: 300, or 72 with --draft)")
+    parser.add_argument("--draft", action="store_true", help="benchmark the draft render mode")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--missing-ratio", type=float, default=0.1,
+                        help="share of products fetched from the stub web server")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--host-interval", type=float, default=0.0,
+                        help="per-host pacing used against the stub server")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+
+    server, search_url_template = start_stub_server()
+    config = {
+        "font": args.font,
+        "search_url_template": search_url_template,
+        "host_interval": args.host_interval,
+        "download_workers": args.download_workers,
+        "max_items": args.max_items,
+        "max_pages": args.max_pages,
+        "save_repeats": args.save_repeats,
+        "format": args.format,
+        "page_size": args.page_size,
+        "columns": args.columns,
+        "rows": args.rows_per_page,
+        "dpi": args.dpi,
+        "draft": args.draft,
+        "duplicate_ratio": args.duplicate_ratio,
+        "missing_ratio": args.missing_ratio,
+    }
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="grid_bench_")
+    results = []
+    try:
+        for rows in [int(value) for value in args.rows.split(",")]:
+            print(f"\n📊 Catalog with {rows} rows")
+            results.extend(benchmark_catalog(rows, workdir, config, stages))
+    finally:
+        server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump({"config": config, "results": results}, f, indent=2)
+    print(f"\n✓ Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,1375 @@
 
-import pandas as pd
+# pandas, tkinter, requests and bs4 are imported lazily on the code paths that need them
 from PIL import Image, ImageDraw, ImageFont
 import os
+import io
+import mmap
 import zipfile
 import shutil
 from datetime import datetime, timedelta
-import tkinter as tk
-from tkinter import filedialog, messagebox
-import requests
-from bs4 import BeautifulSoup
+import argparse
 import urllib.parse
 import time
 import sys
+import threading
+import queue
+import hashlib
+import sqlite3
+import socket
+import uuid
+import json
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-process state for parallel page rendering (set by _init_render_worker)
+_worker_generator = None
+_worker_fonts = None
+
+# Headers to mimic a real browser
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Image extensions searched in the image folder, in priority order
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp']
+
+# Output formats: file extension, PIL format name and save options
+PAGE_FORMATS = {
+    'jpeg': ('.jpg', 'JPEG', {'quality': 95, 'dpi': (300, 300)}),
+    'jpeg-progressive': ('.jpg', 'JPEG', {'quality': 95, 'dpi': (300, 300), 'progressive': True, 'optimize': True}),
+    'webp': ('.webp', 'WEBP', {'quality': 95}),
+    'pdf': ('.pdf', 'PDF', {'resolution': 300, 'quality': 95}),
+}
+
+# HTTP statuses worth retrying with backoff
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Page sizes in points (1/72 inch); the 3508x4961 pages at 300 DPI are A3
+PAGE_SIZES = {
+    'a3': (841.89, 1190.55),
+    'a4': (595.28, 841.89),
+    'letter': (612, 792),
+    'tabloid': (792, 1224),
+}
+
+# Resolution the layout was designed at; draft renders break text lines exactly as this one does
+REFERENCE_DPI = 300
+
+
+class RunMetrics:
+    """Thread-safe stage timings and counters for a run, exportable as a JSON report"""
+    
+    def __init__(self, trace=None):
+        # Optional hook called as trace(stage_name, seconds) after every timed stage
+        self.trace = trace
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block under name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+            
+    def record(self, name, seconds):
+        with self._lock:
+            totals = self._stages.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+        if self.trace:
+            self.trace(name, seconds)
+            
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            
+    def snapshot(self):
+        """Raw stage totals and counters, for shipping from worker processes"""
+        with self._lock:
+            return {"stages": {name: list(totals) for name, totals in self._stages.items()},
+                    "counters": dict(self._counters)}
+            
+    def merge(self, snapshot):
+        """Fold in a snapshot taken in another process"""
+        with self._lock:
+            for name, (calls, seconds, slowest) in snapshot["stages"].items():
+                totals = self._stages.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += calls
+                totals[1] += seconds
+                totals[2] = max(totals[2], slowest)
+            for name, amount in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + amount
+                
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            
+    def report(self):
+        """Machine-readable summary of the run"""
+        snapshot = self.snapshot()
+        stages = {}
+        for name, (calls, seconds, slowest) in sorted(snapshot["stages"].items()):
+            stages[name] = {"calls": calls, "total_s": round(seconds, 4),
+                            "mean_ms": round(seconds / calls * 1000, 3) if calls else 0,
+                            "max_ms": round(slowest * 1000, 3)}
+        return {"started_at": self.started_at.isoformat(timespec="seconds"),
+                "wall_s": round(time.perf_counter() - self._started, 4),
+                "stages": stages,
+                "counters": dict(sorted(snapshot["counters"].items()))}
+                
+    def write_report(self, path, extra=None):
+        report = self.report()
+        if extra:
+            report.update(extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            
+
+class HostRateLimiter:
+    """Spaces out requests to the same host, leaving other hosts unaffected"""
+    
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+        
+    def wait(self, url):
+        """Block until a request to the url's host is allowed"""
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ImageFolderIndex:
+    """File name -> path index of the image folder, built with a single directory scan"""
+    
+    def __init__(self, folder):
+        self.folder = folder
+        self._paths = {}
+        self._mtime_ns = None
+        self._lock = threading.Lock()
+        
+    def refresh(self):
+        """Rescan the folder only if its modification time changed since the last scan"""
+        try:
+            mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            if mtime_ns is not None and mtime_ns == self._mtime_ns:
+                return
+            paths = {}
+            if mtime_ns is not None:
+                with os.scandir(self.folder) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            paths[os.path.normcase(entry.name)] = entry.path
+            self._paths = paths
+            self._mtime_ns = mtime_ns
+            
+    def add(self, path):
+        """Register a file written by this process without rescanning
+
+        The write changed the folder's mtime; adopting the new value keeps the
+        next refresh() from rescanning just because of our own file.
+        """
+        try:
+            mtime_ns = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            self._paths[os.path.normcase(os.path.basename(path))] = path
+            if self._mtime_ns is not None:
+                self._mtime_ns = mtime_ns
+            
+    def get(self, filename):
+        """Path for an exact file name, or None"""
+        return self._paths.get(os.path.normcase(filename))
+        
+    def paths(self):
+        """Paths of all indexed image files"""
+        with self._lock:
+            return [path for name, path in self._paths.items()
+                    if os.path.splitext(name)[1] in IMAGE_EXTENSIONS]
+        
+    def __len__(self):
+        return len(self._paths)
+
+
+class ThumbnailCache:
+    """On-disk cache of images already resized to cell size, capped in bytes with LRU eviction"""
+    
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+        
+    def _entry_path(self, source_key, size):
+        """Cache file for (source image key, target size), or None without a key"""
+        if source_key is None:
+            return None
+        key = f"{source_key}|{size}"
+        return os.path.join(self.folder, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".jpg")
+        
+    def get(self, source_key, size):
+        """Cached derivative as an RGB image, or None on a miss"""
+        entry_path = self._entry_path(source_key, size)
+        if entry_path is None:
+            return None
+        try:
+            img = Image.open(entry_path)
+            img.load()
+        except (OSError, ValueError):
+            return None
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return img
+        
+    def put(self, source_key, size, img):
+        """Store a resized derivative, evicting the least recently used entries over the cap"""
+        entry_path = self._entry_path(source_key, size)
+        if entry_path is None:
+            return
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # About 150-200 KB for an 810px photo, a fifth of a fast PNG, so the cap holds several catalogs.
+            # Lossy: cells drawn from the cache can differ by a few levels from a fresh resize;
+            # 4:4:4 sampling keeps small print and colour edges close
+            img.save(tmp_path, "JPEG", quality=90, subsampling=0)
+            os.replace(tmp_path, entry_path)
+            entry_bytes = os.path.getsize(entry_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+            
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += entry_bytes
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+                
+    def _scan_total(self):
+        total = 0
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(".jpg"):
+                    total += entry.stat().st_size
+        return total
+        
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of the cap"""
+        entries = []
+        with os.scandir(self.folder) as scan:
+            for entry in scan:
+                if entry.name.endswith(".jpg"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another worker may have evicted it already
+                pass
+            total -= size
+        self._total_bytes = total
+
+
+class TextLayout:
+    """Memoized text measurement and word wrapping with bounded LRU caches"""
+    
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._measured = OrderedDict()
+        self._advances = OrderedDict()
+        self._wrapped = OrderedDict()
+        self._lock = threading.Lock()
+        # Scratch surface so measurements match ImageDraw.textbbox exactly
+        self._draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        
+    def _cached(self, cache, key, compute):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        value = compute()
+        with self._lock:
+            cache[key] = value
+            if len(cache) > self.max_entries:
+                cache.popitem(last=False)
+        return value
+        
+    def measure(self, font, text):
+        """(width, height) of text's bounding box"""
+        def compute():
+            bbox = self._draw.textbbox((0, 0), text, font=font)
+            return bbox[2] - bbox[0], bbox[3] - bbox[1]
+        return self._cached(self._measured, (font, text), compute)
+        
+    def advance(self, font, text):
+        """Horizontal advance of text, used to grow lines word by word"""
+        return self._cached(self._advances, (font, text), lambda: font.getlength(text))
+        
+    def wrap(self, font, text, max_width):
+        """Wrap text to max_width; returns a tuple of (line, width, height)"""
+        return self._cached(self._wrapped, (font, text, max_width),
+                            lambda: self._wrap(font, text, max_width))
+        
+    def _wrap(self, font, text, max_width):
+        # Near the limit the summed advances can differ from the real box by a
+        # pixel or two, so confirm those decisions with an exact measurement
+        tolerance = max(2, getattr(font, "size", 10) * 0.25)
+        lines = []
+        current_line = ""
+        current_advance = 0
+        
+        for word in text.split():
+            test_line = current_line + (word + " ")
+            test_advance = current_advance + self.advance(font, word + " ")
+            
+            if abs(test_advance - max_width) <= tolerance:
+                fits = self.measure(font, test_line)[0] <= max_width
+            else:
+                fits = test_advance <= max_width
+                
+            if fits:
+                current_line = test_line
+                current_advance = test_advance
+            else:
+                lines.append(current_line.strip())
+                current_line = word + " "
+                current_advance = self.advance(font, current_line)
+                
+        if current_line:
+            lines.append(current_line.strip())
+            
+        return tuple((line,) + self.measure(font, line) for line in lines)
+
+
+def save_page_image(img, output_path, page_format="jpeg", append=False, dpi=REFERENCE_DPI):
+    """Write a rendered page in one of PAGE_FORMATS, tagged with its resolution"""
+    _, pil_format, options = PAGE_FORMATS[page_format]
+    if 'dpi' in options:
+        options = dict(options, dpi=(dpi, dpi))
+    if 'resolution' in options:
+        options = dict(options, resolution=dpi)
+    if append:
+        img.save(output_path, pil_format, append=True, **options)
+    else:
+        img.save(output_path, pil_format, **options)
+
+
+def process_alive(pid):
+    """True if a process with this id is running on this host"""
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows, so ask for its exit code instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+class PageLayout:
+    """Page geometry in points (1/72 inch), resolved to pixels for one DPI"""
+    
+    def __init__(self, dpi=REFERENCE_DPI, columns=3, rows=4, page_size=PAGE_SIZES['a3']):
+        self.dpi = dpi
+        self.columns = columns
+        self.rows = rows
+        self.page_size = tuple(page_size)
+        self._reference = None
+        px = self.px
+        
+        self.width = px(self.page_size[0])
+        self.height = px(self.page_size[1])
+        # Title and dated sub-header
+        self.title_top = px(19.2)
+        self.subheader_top = px(33.6)
+        self.subheader_line = px(8.4)
+        self.subheader_margin = px(9.6)
+        # Grid below the header band
+        self.header_height = px(96)
+        self.grid_left = px(4.8)
+        self.grid_top = px(72)
+        self.cell_width = self.width // columns
+        self.cell_height = (self.height - self.header_height) // rows
+        # Cell border: inset from the top-left corner, trimmed from the right and bottom
+        self.border_inset = px(2.4)
+        self.border_trim = px(7.2)
+        self.border_width = max(1, px(0.72))
+        # Product name banner
+        self.name_left = px(4.8)
+        self.name_top = px(3.6)
+        self.name_padding = px(2.4)
+        self.name_width = self.cell_width - px(9.6)
+        self.line_gap = px(2.4)
+        # Product image and price
+        self.image_margin = px(14.4)
+        self.image_gap = px(4.8)
+        self.price_space = px(33.6)
+        self.image_min = px(43.2)
+        self.price_right = px(9.6)
+        self.price_bottom = px(28.8)
+        # Title, product name, price and sub-header fonts
+        self.font_sizes = tuple(px(size) for size in (28.8, 14.4, 21.6, 9.6))
+        
+    def px(self, points):
+        """Length in points as whole pixels at this layout's DPI"""
+        return int(round(points * self.dpi / 72))
+        
+    @property
+    def cells_per_page(self):
+        return self.columns * self.rows
+        
+    def reference(self):
+        """The same page and grid at REFERENCE_DPI"""
+        if self.dpi == REFERENCE_DPI:
+            return self
+        if self._reference is None:
+            self._reference = PageLayout(REFERENCE_DPI, self.columns, self.rows, self.page_size)
+        return self._reference
+        
+    def params(self):
+        return {"dpi": self.dpi, "grid": [self.columns, self.rows], "page_size": list(self.page_size),
+                "canvas": [self.width, self.height], "font_sizes": list(self.font_sizes)}
+
+
+class CanvasPool:
+    """Fixed number of reusable page canvases; acquire() blocks while all of them are in use"""
+    
+    def __init__(self, size, capacity):
+        self.size = size
+        self.capacity = max(1, capacity)
+        self._free = []
+        self._owned = set()
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(self.capacity)
+        
+    def acquire(self):
+        """A canvas of self.size; its previous contents must be overwritten by the caller"""
+        self._available.acquire()
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+            canvas = Image.new("RGB", self.size, color=(255, 255, 255))
+            self._owned.add(id(canvas))
+            return canvas
+            
+    def release(self, canvas):
+        """Return a canvas to the pool; canvases the pool did not create are ignored"""
+        with self._lock:
+            if id(canvas) not in self._owned:
+                return
+            self._free.append(canvas)
+        self._available.release()
+
+
+class PageEncoder:
+    """Encodes finished pages on a background thread and feeds the optional PDF and zip bundles"""
+    
+    def __init__(self, page_format="jpeg", pdf_path=None, zip_path=None, max_pending=2, metrics=None,
+                 canvas_pool=None, dpi=REFERENCE_DPI):
+        self.page_format = page_format
+        self.dpi = dpi
+        # Encoded canvases go back to this pool for the next page
+        self.canvas_pool = canvas_pool
+        self.pdf_path = pdf_path
+        self.zip_path = zip_path
+        self.metrics = metrics or RunMetrics()
+        self.pdf_pages = 0
+        # A small queue bounds how many finished canvases wait in memory
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._error = None
+        self._zip = zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) if zip_path else None
+        self._thread = threading.Thread(target=self._run, name="page-encoder", daemon=True)
+        self._thread.start()
+        
+    def submit(self, canvas, output_path):
+        """Queue a page, blocking while the queue is full; canvas is None for pages already on disk"""
+        if self._error:
+            # The page will never be encoded, so its canvas goes straight back
+            if self.canvas_pool and canvas is not None:
+                self.canvas_pool.release(canvas)
+            raise self._error
+        self._queue.put((canvas, output_path))
+        
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                # After a failure keep draining (and releasing canvases) so submitters never block
+                if self._error is None:
+                    self._encode(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                if self.canvas_pool and item[0] is not None:
+                    self.canvas_pool.release(item[0])
+                
+    def _encode(self, canvas, output_path):
+        if canvas is not None:
+            with self.metrics.stage("page_encode"):
+                if self.page_format == "pdf":
+                    # Each page is appended as an incremental update, so only one page is in memory
+                    save_page_image(canvas, self.pdf_path, "pdf", append=self.pdf_pages > 0, dpi=self.dpi)
+                    self.pdf_pages += 1
+                else:
+                    save_page_image(canvas, output_path, self.page_format, dpi=self.dpi)
+        if self._zip and output_path:
+            with self.metrics.stage("zip_write"):
+                self._zip.write(output_path, os.path.basename(output_path))
+                
+    def close(self):
+        """Wait for queued pages, finish the bundles and re-raise any encoding error"""
+        self._queue.put(None)
+        self._thread.join()
+        if self._zip:
+            if self._error is None and self.pdf_pages:
+                self._zip.write(self.pdf_path, os.path.basename(self.pdf_path))
+            self._zip.close()
+        if self._error:
+            raise self._error
+
+
+class TileAtlas:
+    """Cell-sized images stored as raw RGB tiles in one memory-mapped file, with an append-only index
+
+    The index starts with a header naming the layout the tiles were sized for;
+    building for a different layout starts the atlas over. Readers pick up
+    tiles appended by the builder on their next refresh(). Tiles of source
+    images that changed or disappeared are only dropped by compact(), which
+    the builder runs before any page of a run is rendered.
+    """
+    
+    def __init__(self, folder, layout):
+        self.folder = folder
+        self.layout = hashlib.sha1(layout.encode("utf-8")).hexdigest()
+        self.data_path = os.path.join(folder, "tiles.bin")
+        self.index_path = os.path.join(folder, "tiles.idx")
+        self._lock = threading.Lock()
+        self._header = None
+        self._index_pos = 0
+        self._tiles = {}
+        # Source image key of each tile, so compact() can tell which tiles are still used
+        self._sources = {}
+        self._map = None
+        
+    def _key(self, source_key, size):
+        """Tile key for (source image key, tile size), or None without a source key"""
+        if source_key is None:
+            return None
+        return hashlib.sha1(f"{source_key}|{size}".encode("utf-8")).hexdigest()
+        
+    def open_for_build(self):
+        """Start a fresh atlas unless the existing one was built for this layout"""
+        os.makedirs(self.folder, exist_ok=True)
+        try:
+            with open(self.index_path, "rb") as index_file:
+                header = index_file.readline().decode("utf-8").split("\t")
+        except OSError:
+            header = []
+        if len(header) != 3 or header[1] != self.layout:
+            with self._lock:
+                self._close_map()
+                # A new build id tells readers that earlier offsets are void
+                with open(self.data_path, "wb"):
+                    pass
+                with open(self.index_path, "wb") as index_file:
+                    index_file.write(f"tile-atlas\t{self.layout}\t{time.time_ns()}\n".encode("utf-8"))
+        self.refresh()
+        
+    def refresh(self):
+        """Load index entries appended since the last refresh"""
+        with self._lock:
+            try:
+                with open(self.index_path, "rb") as index_file:
+                    header = index_file.readline()
+                    if header != self._header:
+                        # Rebuilt (or first read): forget everything from the old build
+                        self._header = header
+                        self._index_pos = len(header)
+                        self._tiles = {}
+                        self._sources = {}
+                        self._close_map()
+                    index_file.seek(self._index_pos)
+                    chunk = index_file.read()
+            except OSError:
+                return
+                
+            fields = self._header.decode("utf-8").rstrip("\n").split("\t")
+            usable = len(fields) == 3 and fields[1] == self.layout
+            # Only whole lines; a partly written entry is read next time
+            end = chunk.rfind(b"\n") + 1
+            self._index_pos += end
+            if not usable:
+                return
+            for line in chunk[:end].decode("utf-8").splitlines():
+                key, offset, size, source = line.split("\t")
+                self._tiles[key] = (int(offset), int(size))
+                self._sources[key] = source
+                
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            
+    def _mapped(self, end):
+        """The data file mapping, remapped if it does not reach end yet"""
+        if self._map is None or len(self._map) < end:
+            self._close_map()
+            with open(self.data_path, "rb") as data_file:
+                self._map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+        
+    def get(self, source_key, size):
+        """The tile as an RGB image, or None if the atlas does not hold it"""
+        key = self._key(source_key, size)
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is None:
+                return None
+            offset, size = entry
+            length = size * size * 3
+            try:
+                data = self._mapped(offset + length)
+            except (OSError, ValueError):
+                return None
+            # Raw pixels straight from the mapping: one copy, no decode or resample
+            with memoryview(data)[offset:offset + length] as view:
+                return Image.frombytes("RGB", (size, size), view)
+                
+    def __contains__(self, item):
+        source_key, size = item
+        with self._lock:
+            return self._key(source_key, size) in self._tiles
+            
+    def add(self, source_key, size, img):
+        """Append a cell-sized RGB image; the data is written before its index entry"""
+        key = self._key(source_key, size)
+        if key is None or img.size != (size, size) or img.mode != "RGB":
+            return
+        with self._lock:
+            if key in self._tiles:
+                return
+            with open(self.data_path, "ab") as data_file:
+                offset = data_file.tell()
+                data_file.write(img.tobytes())
+            # A key that would break the line format is stored as unknown, so compaction drops it
+            source = source_key if "\t" not in source_key and "\n" not in source_key else ""
+            with open(self.index_path, "ab") as index_file:
+                line = f"{key}\t{offset}\t{size}\t{source}\n".encode("utf-8")
+                index_file.write(line)
+            self._index_pos += len(line)
+            self._tiles[key] = (offset, size)
+            self._sources[key] = source
+            
+    def compact(self, live_sources, max_dead_share=0.5):
+        """Rewrite the atlas with only tiles whose source key is in live_sources, once the
+        rest take up more than max_dead_share of the data file; returns the number of tiles dropped
+        
+        Readers holding the old mapping keep valid tiles; they switch to the new
+        file on their next refresh(), since the rewrite gets a new build id.
+        """
+        with self._lock:
+            try:
+                data_bytes = os.path.getsize(self.data_path)
+            except OSError:
+                return 0
+            live = sorted((offset, size, key) for key, (offset, size) in self._tiles.items()
+                          if self._sources.get(key) in live_sources)
+            live_bytes = sum(size * size * 3 for _, size, _ in live)
+            if not data_bytes or 1 - live_bytes / data_bytes <= max_dead_share:
+                return 0
+                
+            header = f"tile-atlas\t{self.layout}\t{time.time_ns()}\n".encode("utf-8")
+            data_tmp = f"{self.data_path}.{os.getpid()}.tmp"
+            index_tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            tiles = {}
+            try:
+                data = self._mapped(data_bytes) if live else None
+                with open(data_tmp, "wb") as data_file, open(index_tmp, "wb") as index_file:
+                    index_file.write(header)
+                    for offset, size, key in live:
+                        new_offset = data_file.tell()
+                        data_file.write(data[offset:offset + size * size * 3])
+                        index_file.write(f"{key}\t{new_offset}\t{size}\t{self._sources[key]}\n".encode("utf-8"))
+                        tiles[key] = (new_offset, size)
+                    index_pos = index_file.tell()
+                self._close_map()
+                # Data first, then the index with the new build id; the builder compacts
+                # before a run renders anything, so no reader remaps in between
+                os.replace(data_tmp, self.data_path)
+                os.replace(index_tmp, self.index_path)
+            except (OSError, ValueError):
+                # e.g. Windows refuses to replace a file another process has mapped
+                for path in (data_tmp, index_tmp):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                return 0
+            dropped = len(self._tiles) - len(tiles)
+            self._header = header
+            self._index_pos = index_pos
+            self._sources = {key: self._sources[key] for key in tiles}
+            self._tiles = tiles
+            return dropped
+            
+    def __len__(self):
+        return len(self._tiles)
+
+
+class LookupCache:
+    """SQLite-backed memory of web lookups: search results, downloads and recent failures"""
+    
+    def __init__(self, path, search_ttl=30 * 86400, download_ttl=7 * 86400,
+                 failure_ttl=86400, max_failure_ttl=30 * 86400):
+        self.path = path
+        self.search_ttl = search_ttl
+        # Downloads younger than this are reused without asking the server again
+        self.download_ttl = download_ttl
+        # Failed products wait failure_ttl, doubling per failed attempt up to max_failure_ttl
+        self.failure_ttl = failure_ttl
+        self.max_failure_ttl = max_failure_ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS searches "
+                               "(query TEXT PRIMARY KEY, urls TEXT, fetched_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS downloads "
+                               "(url TEXT PRIMARY KEY, path TEXT, etag TEXT, last_modified TEXT, fetched_at REAL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS failures "
+                               "(product TEXT PRIMARY KEY, attempts INTEGER, failed_at REAL)")
+            
+    def _fetchone(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+            
+    def _write(self, sql, params):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+            
+    def get_search(self, query):
+        """Cached image URLs for a search query, or None if unknown, stale or empty"""
+        row = self._fetchone("SELECT urls, fetched_at FROM searches WHERE query = ?", (query,))
+        if row is None or time.time() - row[1] > self.search_ttl:
+            return None
+        return json.loads(row[0]) or None
+        
+    def put_search(self, query, urls):
+        # Searches that found nothing are left to the failure retry delay instead
+        if not urls:
+            return
+        self._write("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (query, json.dumps(urls), time.time()))
+        
+    def get_download(self, url):
+        """{'path', 'etag', 'last_modified', 'fresh'} for a URL downloaded before, or None"""
+        row = self._fetchone("SELECT path, etag, last_modified, fetched_at FROM downloads WHERE url = ?", (url,))
+        if row is None:
+            return None
+        return {"path": row[0], "etag": row[1], "last_modified": row[2],
+                "fresh": time.time() - row[3] <= self.download_ttl}
+                
+    def put_download(self, url, path, etag=None, last_modified=None):
+        self._write("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?)",
+                    (url, path, etag, last_modified, time.time()))
+        
+    def should_skip(self, product):
+        """True while a product's last failed lookup is still within its retry delay"""
+        row = self._fetchone("SELECT attempts, failed_at FROM failures WHERE product = ?", (product,))
+        if row is None:
+            return False
+        delay = min(self.failure_ttl * (2 ** (row[0] - 1)), self.max_failure_ttl)
+        return time.time() - row[1] < delay
+        
+    def record_failure(self, product):
+        self._write("INSERT INTO failures VALUES (?, 1, ?) ON CONFLICT(product) DO UPDATE "
+                    "SET attempts = attempts + 1, failed_at = excluded.failed_at", (product, time.time()))
+        
+    def clear_failure(self, product):
+        self._write("DELETE FROM failures WHERE product = ?", (product,))
+
+
+class ImageContentIndex:
+    """Persistent SHA-256 (and optional perceptual dHash) of image files, keyed by path, mtime and size"""
+    
+    def __init__(self, path, perceptual=False):
+        self.path = path
+        self.perceptual = perceptual
+        self._lock = threading.Lock()
+        self._known = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS images "
+                               "(stat_key TEXT PRIMARY KEY, path TEXT, sha256 TEXT, dhash TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)")
+            
+    def lookup(self, path, stat_key):
+        """(sha256, dhash) of a file, hashing it only when this version has not been seen before"""
+        entry = self._known.get(stat_key)
+        if entry is not None and (entry[1] or not self.perceptual):
+            return entry
+        with self._lock:
+            row = self._conn.execute("SELECT sha256, dhash FROM images WHERE stat_key = ?", (stat_key,)).fetchone()
+        if row is None or (self.perceptual and not row[1]):
+            digest = row[0] if row else self.file_digest(path)
+            dhash = self.perceptual_hash(path) if self.perceptual else None
+            row = (digest, dhash)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?)",
+                                   (stat_key, os.path.abspath(path), digest, dhash))
+        self._known[stat_key] = tuple(row)
+        return self._known[stat_key]
+        
+    def paths_with_digest(self, digest):
+        """Files last seen with this content digest"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM images WHERE sha256 = ?", (digest,))]
+            
+    @staticmethod
+    def file_digest(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as image_file:
+            for block in iter(lambda: image_file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+        
+    @staticmethod
+    def perceptual_hash(path):
+        """64-bit difference hash plus a coarse 2x2 colour signature
+
+        The dHash only sees brightness, so colour variants of one package
+        (flavours, sizes) share it; the colour signature keeps them apart.
+        Rescaled copies and re-encodes of one picture usually match both.
+        """
+        img = Image.open(path)
+        if img.format == "JPEG":
+            img.draft("RGB", (64, 64))
+        img = img.convert("RGB")
+        pixels = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR).tobytes()
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        # Mean colour of each quadrant, 8 levels per channel
+        colours = img.resize((2, 2), Image.Resampling.BOX).tobytes()
+        return f"{bits:016x}-" + "".join(f"{value >> 5:x}" for value in colours)
+        
+    def close(self):
+        self._conn.close()
+
+
+class RenderJobQueue:
+    """Durable SQLite queue of page shards that worker processes claim, render and check off
+
+    Claims are leases: a shard whose worker died becomes claimable again once
+    its lease runs out. Several hosts can share one job file on a common
+    filesystem, as long as that filesystem supports SQLite's file locks.
+    """
+    
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS shards "
+                           "(page_number INTEGER PRIMARY KEY, products TEXT, status TEXT, owner TEXT, "
+                           "lease_until REAL, attempts INTEGER DEFAULT 0, output TEXT, error TEXT)")
+        
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front so two claimers never pick the same shard
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        
+    def meta(self):
+        return dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        
+    def create(self, meta, pages):
+        """Record job settings and (page_number, products) shards unless the job already exists; returns the meta"""
+        with self._transaction() as conn:
+            existing = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            if existing:
+                return existing
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", list(meta.items()))
+            conn.executemany("INSERT INTO shards (page_number, products, status) VALUES (?, ?, 'pending')",
+                             ((page_number, json.dumps(products)) for page_number, products in pages))
+        return meta
+        
+    def claim(self, owner):
+        """Lease the lowest pending (or abandoned) shard; returns (page_number, products) or None
+
+        owner is "host:pid". Shards leased by a process on the same host that
+        no longer exists are taken back at once instead of waiting out the lease.
+        """
+        now = time.time()
+        host = owner.rpartition(":")[0]
+        with self._transaction() as conn:
+            dead = [(page_number,) for page_number, other in conn.execute(
+                        "SELECT page_number, owner FROM shards WHERE status = 'claimed' AND lease_until >= ?", (now,))
+                    if other and other != owner and other.rpartition(":")[0] == host
+                    and not process_alive(int(other.rpartition(":")[2]))]
+            conn.executemany("UPDATE shards SET status = 'pending', owner = NULL, lease_until = NULL "
+                             "WHERE page_number = ?", dead)
+            row = conn.execute("SELECT page_number, products FROM shards "
+                               "WHERE status = 'pending' OR (status = 'claimed' AND lease_until < ?) "
+                               "ORDER BY page_number LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE shards SET status = 'claimed', owner = ?, lease_until = ? WHERE page_number = ?",
+                         (owner, now + self.lease_seconds, row[0]))
+        return row[0], json.loads(row[1])
+        
+    def complete(self, page_number, output):
+        """Checkpoint a rendered shard"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET status = 'done', output = ?, error = NULL WHERE page_number = ?",
+                         (output, page_number))
+            
+    def release(self, page_number, error):
+        """Return a failed shard to the queue, or mark it failed after max_attempts"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE shards SET attempts = attempts + 1, error = ?, owner = NULL, lease_until = NULL, "
+                         "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END "
+                         "WHERE page_number = ?", (error, self.max_attempts, page_number))
+            
+    def progress(self):
+        """Shard counts by status"""
+        return dict(self._conn.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+        
+    def outputs(self):
+        """Output files of completed shards, in page order"""
+        return [row[0] for row in self._conn.execute(
+            "SELECT output FROM shards WHERE status = 'done' ORDER BY page_number")]
+            
+    def close(self):
+        self._conn.close()
+
+
+class RenderService:
+    """Local render daemon: one warm generator renders uploaded CSVs from a bounded job queue
+
+    Jobs run one at a time in this process, so fonts, page templates, the
+    image index and recently decoded images stay loaded between requests.
+    """
+    
+    # Generator settings a job may override; restored after every job
+    JOB_SETTINGS = ('output_folder', 'page_format', 'effective_date', 'layout', 'draft', 'resample',
+                    'use_thumbnail_cache', 'use_tile_atlas', 'store_title', 'store_address')
+    
+    def __init__(self, generator, max_queued=8, max_upload_bytes=50 * 1024 * 1024, keep_jobs=50):
+        self.generator = generator
+        self.max_upload_bytes = max_upload_bytes
+        self.keep_jobs = keep_jobs
+        self.jobs_folder = os.path.join(generator.output_folder, "service_jobs")
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="render-service", daemon=True)
+        
+    def warm_up(self):
+        """Load fonts and scan the image folder before the first request"""
+        os.makedirs(self.jobs_folder, exist_ok=True)
+        self.generator.load_fonts()
+        self.generator.get_image_index().refresh()
+        
+    def submit(self, csv_bytes, options):
+        """Queue a CSV for rendering; returns the job, or None when the queue is full"""
+        job_id = uuid.uuid4().hex[:12]
+        job_folder = os.path.join(self.jobs_folder, job_id)
+        job = {"id": job_id, "status": "queued", "options": options, "submitted": time.time(),
+               "folder": job_folder, "outputs": [], "error": None}
+        os.makedirs(job_folder)
+        with open(os.path.join(job_folder, "input.csv"), "wb") as csv_file:
+            csv_file.write(csv_bytes)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                shutil.rmtree(job_folder, ignore_errors=True)
+                return None
+            self._jobs[job_id] = job
+        return self.job(job_id)
+        
+    def job(self, job_id):
+        """Public view of a job, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            view = {key: value for key, value in job.items() if key != "folder"}
+            view["outputs"] = [os.path.basename(path) for path in job["outputs"]]
+            return view
+            
+    def job_file(self, job_id, name):
+        """Path of a finished job's output file, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "done":
+                return None
+            for path in job["outputs"]:
+                if os.path.basename(path) == name:
+                    return path
+        return None
+        
+    def bundle(self, job_id):
+        """The job's PDF, or a zip of its pages built on first request; None until the job is done"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "done":
+                return None
+            outputs = list(job["outputs"])
+            folder = job["folder"]
+        if len(outputs) == 1 and outputs[0].endswith(".pdf"):
+            return outputs[0]
+        zip_path = os.path.join(folder, "pages.zip")
+        if not os.path.exists(zip_path):
+            temp_path = f"{zip_path}.{threading.get_ident()}.tmp"
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as bundle:
+                for path in outputs:
+                    bundle.write(path, os.path.basename(path))
+            os.replace(temp_path, zip_path)
+        return zip_path
+        
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"queued": self._queue.qsize(), "capacity": self._queue.maxsize, "jobs": counts,
+                "metrics": self.generator.metrics.snapshot()}
+                
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs[job_id]
+                job["status"] = "running"
+                job["started"] = time.time()
+            try:
+                outputs = self._render(job)
+                status, error = "done", None
+            except Exception as e:
+                outputs, status, error = [], "failed", str(e)
+                self.generator.log(f"❌ Job {job_id} failed: {e}")
+            with self._lock:
+                job.update(status=status, error=error, outputs=outputs, finished=time.time())
+                self._expire_jobs()
+                
+    def _render(self, job):
+        """Render one job with its options applied on top of the service's settings"""
+        generator = self.generator
+        options = job["options"]
+        saved = {name: getattr(generator, name) for name in self.JOB_SETTINGS}
+        try:
+            generator.output_folder = job["folder"]
+            generator.page_format = options.get("format", generator.page_format)
+            if options.get("effective_date"):
+                generator.effective_date = options["effective_date"]
+            if options.get("title"):
+                generator.store_title = options["title"]
+            if options.get("address"):
+                generator.store_address = options["address"]
+            if options.get("draft"):
+                layout = generator.layout
+                generator.configure_layout(None, layout.columns, layout.rows, layout.page_size, draft=True)
+            return generator.generate_from_csv(os.path.join(job["folder"], "input.csv"))
+        finally:
+            for name, value in saved.items():
+                setattr(generator, name, value)
+            if options.get("draft"):
+                # The pool holds draft-sized canvases
+                generator._canvas_pool = None
+                
+    def _expire_jobs(self):
+        """Forget the oldest finished jobs beyond keep_jobs, deleting their files (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.keep_jobs)]:
+            shutil.rmtree(self._jobs.pop(job_id)["folder"], ignore_errors=True)
+            
+    def serve(self, host="127.0.0.1", port=8765):
+        """Serve the HTTP API until interrupted"""
+        self.warm_up()
+        self._worker.start()
+        server = ThreadingHTTPServer((host, port), _RenderRequestHandler)
+        server.service = self
+        self.generator.log(f"🛰 Render service listening on http://{host}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+
+class _RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP API of RenderService
+
+    POST /render?format=jpeg&draft=1&effective_date=YYYY-MM-DD&title=...&address=...  (body: CSV) -> 202 job
+    GET  /jobs/<id>                  job status and output names
+    GET  /jobs/<id>/bundle           PDF or zip of the pages
+    GET  /jobs/<id>/files/<name>     one page
+    GET  /health                     queue depth, job counts and metrics
+    """
+    
+    def do_POST(self):
+        service = self.server.service
+        parsed = urllib.parse.urlsplit(self.path)
+        if parsed.path != "/render":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = self.headers.get("Content-Length")
+        if not length or not length.isdigit():
+            self._send_json(411, {"error": "Content-Length required"})
+            return
+        if int(length) > service.max_upload_bytes:
+            self._send_json(413, {"error": f"CSV larger than {service.max_upload_bytes} bytes"})
+            return
+        csv_bytes = self.rfile.read(int(length))
+        
+        query = urllib.parse.parse_qs(parsed.query)
+        options = {}
+        try:
+            if "format" in query:
+                if query["format"][0] not in PAGE_FORMATS:
+                    raise ValueError(f"format must be one of {sorted(PAGE_FORMATS)}")
+                options["format"] = query["format"][0]
+            if "effective_date" in query:
+                options["effective_date"] = datetime.strptime(query["effective_date"][0], "%Y-%m-%d")
+            options["draft"] = query.get("draft", ["0"])[0] in ("1", "true", "yes")
+            for name in ("title", "address"):
+                if name in query:
+                    options[name] = query[name][0]
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+            
+        job = service.submit(csv_bytes, options)
+        if job is None:
+            self._send_json(503, {"error": "render queue is full"}, {"Retry-After": "30"})
+            return
+        job["options"] = {key: str(value) for key, value in job["options"].items()}
+        self._send_json(202, job, {"Location": f"/jobs/{job['id']}"})
+        
+    def do_GET(self):
+        service = self.server.service
+        parts = [urllib.parse.unquote(part) for part in urllib.parse.urlsplit(self.path).path.split("/") if part]
+        if parts == ["health"]:
+            self._send_json(200, service.status())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = service.job(parts[1])
+            if job is None:
+                self._send_json(404, {"error": "unknown job"})
+                return
+            job["options"] = {key: str(value) for key, value in job["options"].items()}
+            self._send_json(200, job)
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "bundle":
+            self._send_file(service.bundle(parts[1]))
+        elif len(parts) == 4 and parts[0] == "jobs" and parts[2] == "files":
+            self._send_file(service.job_file(parts[1], parts[3]))
+        else:
+            self._send_json(404, {"error": "not found"})
+            
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def _send_file(self, path):
+        if not path or not os.path.exists(path):
+            self._send_json(404, {"error": "not ready or not found"})
+            return
+        content_types = {".pdf": "application/pdf", ".zip": "application/zip",
+                         ".jpg": "image/jpeg", ".webp": "image/webp"}
+        self.send_response(200)
+        self.send_header("Content-Type", content_types.get(os.path.splitext(path)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, "rb") as output_file:
+            shutil.copyfileobj(output_file, self.wfile)
+            
+    def log_message(self, format, *args):
+        self.server.service.generator.log(f"🛰 {self.address_string()} {format % args}")
+
+
+class ProductRecord:
+    """A product prepared for rendering: its labels and image are resolved before any page is drawn"""
+    __slots__ = ("name", "display_name", "price_label", "image_path", "image_found")
+    
+    def __init__(self, name, display_name, price_label, image_path=None, image_found=None):
+        self.name = name
+        self.display_name = display_name
+        self.price_label = price_label
+        self.image_path = image_path
+        # True/False once image acquisition has run for this product, None if it has not
+        self.image_found = image_found
+
+
 
 class ProductGridGenerator:
-    def __init__(self):
-        # Fixed paths as specified
-        self.project_folder = r"C:\Users\mahen\OneDrive\Desktop\image_project"
-        self.image_folder = r"C:\Users\mahen\OneDrive\Desktop\image_project\image"
+    def __init__(self, project_folder=None, image_folder=None, output_folder=None, font_path=None):
+        # Fixed paths as specified, unless overridden (e.g. from the command line)
+        self.project_folder = project_folder or r"C:\Users\mahen\OneDrive\Desktop\image_project"
+        self.image_folder = image_folder or os.path.join(self.project_folder, "image")
         # FIXED: Output directly to the output folder, no subfolders
-        self.output_folder = r"C:\Users\mahen\OneDrive\Desktop\image_project\output"
-        self.font_path = None
+        self.output_folder = output_folder or os.path.join(self.project_folder, "output")
+        self.font_path = font_path
+        # Set to False to skip web searches and use placeholders for missing images
+        self.web_search = True
+        # Progress output; set to False for quiet runs (metrics are still collected)
+        self.verbose = True
+        self.metrics = RunMetrics()
+        # Parallel rendering: 1 keeps the original one-page-at-a-time behaviour
+        self.render_workers = 1
+        self.pages_per_batch = 4
+        # Web image acquisition: bounded concurrency, per-host pacing and retries
+        self.search_url_template = "https://www.google.com/search?q={query}&tbm=isch"
+        self.download_workers = 4
+        self.host_min_interval = 1.0
+        self.max_retries = 3
+        self.retry_backoff = 0.5
+        self._http_session = None
+        self._session_lock = threading.Lock()
+        self._rate_limiter = HostRateLimiter(self.host_min_interval)
+        # Persistent lookup cache (None = <project_folder>/.lookup_cache.sqlite)
+        self.use_lookup_cache = True
+        self.lookup_cache_path = None
+        self.failure_retry_hours = 24
+        # Limits for downloaded images, and the longest side they are stored at
+        self.max_download_bytes = 15 * 1024 * 1024
+        self.max_image_pixels = 40_000_000
+        self.download_max_side = 800
+        self._lookup_cache = None
+        self._image_index = None
+        # Products without a real image; their placeholders are only drawn at render time
+        self.placeholders = set()
+        self._placeholder_base = None
+        self._placeholder_lock = threading.Lock()
+        self.text_layout = TextLayout()
+        self._page_templates = {}
+        # Streaming mode: read the CSV in chunks and render pages as they fill
+        self.stream_csv = False
+        self.csv_chunk_size = 5000
+        # Output: one of PAGE_FORMATS ('pdf' writes a single multi-page file), plus an optional zip
+        self.page_format = "jpeg"
+        self.zip_bundle = False
+        self.encode_queue_size = 2
+        # Cap on memory for page buffers in flight (None = one buffer per queued page plus one)
+        self.memory_budget_mb = None
+        self._canvas_pool = None
+        # Incremental builds: only re-render pages whose content hash changed
+        self.incremental = False
+        # First day of the price period shown in the header (None = today)
+        self.effective_date = None
+        # Page header: store name (title) and address
+        self.store_title = "Main Street\nMarket"
+        self.store_address = "100 Railroad Avenue, Denmark, WI, United States, Wisconsin"
+        # Cell-sized thumbnails persisted between runs (None = <project_folder>/.thumbnail_cache)
+        self.use_thumbnail_cache = True
+        self.thumbnail_cache_folder = None
+        self.thumbnail_cache_max_mb = 1024
+        self._thumbnail_cache = None
+        # Page geometry; draft mode renders proofs at low DPI with fast resampling
+        self.layout = PageLayout()
+        self.draft = False
+        self.resample = Image.Resampling.LANCZOS
+        self._reference_fonts = {}
+        self._font_sets = {}
+        # Content-addressed images: identical files share one derivative and, on disk, one hardlinked file
+        self.dedupe_images = False
+        self.perceptual_dedupe = False
+        self.derivative_memory_entries = 32
+        # Keep recently decoded derivatives in memory even without deduplication (render service)
+        self.warm_derivatives = False
+        self._content_index = None
+        self._derivatives = OrderedDict()
+        self._derivatives_lock = threading.Lock()
+        # Raw tiles for the current layout (None = <project_folder>/.tile_atlas)
+        self.use_tile_atlas = False
+        self.tile_atlas_folder = None
+        # Rewrite the atlas once tiles of changed or deleted images pass this share of its file
+        self.tile_atlas_max_dead_share = 0.5
+        self._tile_atlas = None
+        self._atlas_fonts = None
         
+    def log(self, message):
+        """Print progress output unless running quietly"""
+        if self.verbose:
+            print(message)
+            
     def setup_directories(self):
-        """Create necessary directories and verify project structure"""
+        """Verify project structure and create the image and output folders"""
+        # Verify project folder exists before creating anything inside it
+        if not os.path.isdir(self.project_folder):
+            raise Exception(f"Project folder not found: {self.project_folder}")
+            
         # Create all necessary directories
         os.makedirs(self.image_folder, exist_ok=True)
         os.makedirs(self.output_folder, exist_ok=True)
         
-        # Verify project folder exists
-        if not os.path.exists(self.project_folder):
-            raise Exception(f"Project folder not found: {self.project_folder}")
-            
-        print(f"✓ Image folder: {self.image_folder}")
-        print(f"✓ Output folder: {self.output_folder}")
+        self.log(f"✓ Image folder: {self.image_folder}")
+        self.log(f"✓ Output folder: {self.output_folder}")
         
+        if self.font_path:
+            self.log(f"✓ Using font: {self.font_path}")
+            return
+            
         # Find font file
         font_files = []
         for file in os.listdir(self.project_folder):
@@ -43,13 +1378,15 @@ class ProductGridGenerator:
                 
         if font_files:
             self.font_path = os.path.join(self.project_folder, font_files[0])
-            print(f"✓ Found font: {font_files[0]}")
+            self.log(f"✓ Found font: {font_files[0]}")
         else:
-            print("⚠ No font file found in project folder. Will use system font.")
+            self.log("⚠ No font file found in project folder. Will use system font.")
             
     def select_csv_file(self):
         """Select CSV file using file dialog"""
         print("\nPlease select your CSV file with columns: Product Name, Quantity, For, Price")
+        import tkinter as tk
+        from tkinter import filedialog
         
         root = tk.Tk()
         root.withdraw()
@@ -67,31 +1404,78 @@ class ProductGridGenerator:
         
     def load_fonts(self):
         """Load fonts with optimized sizes for better proportions"""
+        fonts = self.load_font_set(self.layout.font_sizes)
+        if self.layout.dpi != REFERENCE_DPI:
+            # Text is wrapped with the full-resolution fonts so drafts break lines like the final pages
+            reference_fonts = self.load_font_set(self.layout.reference().font_sizes)
+            self._reference_fonts.update(zip(fonts, reference_fonts))
+        return fonts
+        
+    def load_font_set(self, sizes):
+        """(header, product name, price, sub-header) fonts at the given pixel sizes, loaded once per font file"""
+        key = (self.font_path, tuple(sizes))
+        fonts = self._font_sets.get(key)
+        if fonts is not None:
+            return fonts
+        header_size, product_size, price_size, header_attr_size = sizes
         try:
             if self.font_path and os.path.exists(self.font_path):
                 # Larger font sizes for better visibility (adjusted to fit header)
-                header_font = ImageFont.truetype(self.font_path, 120)      # Header
-                product_font = ImageFont.truetype(self.font_path, 60)      # Product name
-                price_font = ImageFont.truetype(self.font_path, 90)        # Price
-                header_attr_font = ImageFont.truetype(self.font_path, 40)  # Sub-header
-                print("✓ Loaded custom fonts successfully.")
+                header_font = ImageFont.truetype(self.font_path, header_size)            # Header
+                product_font = ImageFont.truetype(self.font_path, product_size)          # Product name
+                price_font = ImageFont.truetype(self.font_path, price_size)              # Price
+                header_attr_font = ImageFont.truetype(self.font_path, header_attr_size)  # Sub-header
+                self.log("✓ Loaded custom fonts successfully.")
             else:
                 raise IOError("Font not found")
         except IOError:
-            print("⚠ Custom font not found. Using system fonts.")
+            self.log("⚠ Custom font not found. Using system fonts.")
             try:
                 # Try to use system Arial font
-                header_font = ImageFont.truetype("arial.ttf", 120)
-                product_font = ImageFont.truetype("arial.ttf", 60)
-                price_font = ImageFont.truetype("arial.ttf", 90)
-                header_attr_font = ImageFont.truetype("arial.ttf", 40)
+                header_font = ImageFont.truetype("arial.ttf", header_size)
+                product_font = ImageFont.truetype("arial.ttf", product_size)
+                price_font = ImageFont.truetype("arial.ttf", price_size)
+                header_attr_font = ImageFont.truetype("arial.ttf", header_attr_size)
             except:
                 # Fall back to default fonts
                 header_font = ImageFont.load_default()
                 product_font = ImageFont.load_default()
                 price_font = ImageFont.load_default()
                 header_attr_font = ImageFont.load_default()
-        return header_font, product_font, price_font, header_attr_font
+        self._font_sets[key] = (header_font, product_font, price_font, header_attr_font)
+        return self._font_sets[key]
+        
+    def configure_layout(self, dpi=None, columns=3, rows=4, page_size='a3', draft=False):
+        """Set page size (a PAGE_SIZES name or points), grid and resolution; draft mode defaults to 72 DPI with fast resampling"""
+        if dpi is None:
+            dpi = 72 if draft else REFERENCE_DPI
+        if isinstance(page_size, str):
+            page_size = PAGE_SIZES[page_size]
+        self.layout = PageLayout(dpi, columns, rows, page_size)
+        self.draft = draft
+        self.resample = Image.Resampling.BILINEAR if draft else Image.Resampling.LANCZOS
+        if draft:
+            # Keep proof-quality derivatives out of the caches that final renders read
+            self.use_thumbnail_cache = False
+            self.use_tile_atlas = False
+        self._page_templates = {}
+        self._canvas_pool = None
+        self._reference_fonts = {}
+        
+    def wrap_text(self, font, text, max_width, reference_width=None):
+        """Wrap text to max_width as (line, width, height) tuples for the current layout
+
+        Below the reference DPI the line breaks come from the reference-size font
+        at reference_width (max_width measured on the 300 DPI layout), so drafts
+        wrap exactly like the final pages.
+        """
+        reference_font = self._reference_fonts.get(font)
+        if reference_font is None:
+            return self.text_layout.wrap(font, text, max_width)
+        if reference_width is None:
+            reference_width = round(max_width * REFERENCE_DPI / self.layout.dpi)
+        reference_lines = self.text_layout.wrap(reference_font, text, reference_width)
+        return tuple((line, *self.text_layout.measure(font, line)) for line, _, _ in reference_lines)
         
     def clean_text_for_filename(self, text):
         """Clean text for safe filename usage but keep original for search"""
@@ -102,17 +1486,17 @@ class ProductGridGenerator:
         text = text.replace("<", "_").replace(">", "_").replace("|", "_")
         return text
         
-    def find_local_image(self, product_name):
-        """Find image for product in local image folder - search with exact name first"""
-        # First try exact product name with common extensions
-        extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp']
+    def get_image_index(self):
+        """Index of the image folder, scanned on first use"""
+        if self._image_index is None or self._image_index.folder != self.image_folder:
+            self._image_index = ImageFolderIndex(self.image_folder)
+            self._image_index.refresh()
+        return self._image_index
         
+    def local_image_candidates(self, product_name):
+        """File names tried for a product, in priority order"""
         # Try exact product name first (as downloaded from web)
-        for ext in extensions:
-            exact_path = os.path.join(self.image_folder, product_name + ext)
-            if os.path.exists(exact_path):
-                print(f"✓ Found exact match: {product_name}{ext}")
-                return exact_path
+        candidates = [product_name + ext for ext in IMAGE_EXTENSIONS]
         
         # If exact match not found, try cleaned versions
         clean_name = self.clean_text_for_filename(product_name).lower()
@@ -129,120 +1513,307 @@ class ProductGridGenerator:
         ]
         
         for pattern in name_patterns:
-            for ext in extensions:
-                image_path = os.path.join(self.image_folder, pattern + ext)
-                if os.path.exists(image_path):
-                    print(f"✓ Found alternative match: {pattern}{ext}")
-                    return image_path
-                    
-        return None
+            for ext in IMAGE_EXTENSIONS:
+                candidates.append(pattern + ext)
+                
+        return candidates
         
-    def search_and_download_image(self, product_name):
-        """Search for product image on the web and download it with exact product name"""
-        try:
-            print(f"🔍 Searching web for: {product_name}")
+    def find_local_image(self, product_name):
+        """Find image for product in local image folder - search with exact name first"""
+        index = self.get_image_index()
+        
+        with self.metrics.stage("local_lookup"):
+            for position, filename in enumerate(self.local_image_candidates(product_name)):
+                image_path = index.get(filename)
+                if image_path:
+                    break
+            else:
+                image_path = None
+                
+        if image_path is None:
+            self.metrics.count("local_miss")
+            return None
             
-            # Search query
-            search_query = f"{product_name} product image"
-            search_url = f"https://www.google.com/search?q={urllib.parse.quote(search_query)}&tbm=isch"
+        self.metrics.count("local_hit")
+        if self.verbose:
+            if position < len(IMAGE_EXTENSIONS):
+                self.log(f"✓ Found exact match: {filename}")
+            else:
+                self.log(f"✓ Found alternative match: {filename}")
+        return image_path
+        
+    def get_http_session(self):
+        """Shared HTTP session with a connection pool sized for the download workers"""
+        with self._session_lock:
+            if self._http_session is None:
+                import requests
+                import requests.adapters
+                session = requests.Session()
+                pool_size = max(self.download_workers, 1)
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update(BROWSER_HEADERS)
+                self._http_session = session
+            return self._http_session
             
-            # Headers to mimic a real browser
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+    def http_get(self, url, **kwargs):
+        """GET through the pooled session with per-host pacing and retry with backoff"""
+        import requests
+        session = self.get_http_session()
+        self._rate_limiter.min_interval = self.host_min_interval
+        
+        for attempt in range(self.max_retries + 1):
+            self._rate_limiter.wait(url)
+            try:
+                response = session.get(url, **kwargs)
+            except requests.RequestException:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                response.close()
+            time.sleep(self.retry_backoff * (2 ** attempt))
             
-            # Get search results
-            response = requests.get(search_url, headers=headers, timeout=10)
-            if response.status_code != 200:
-                print(f"⚠ Search failed for {product_name}")
-                return None
+    def get_lookup_cache(self):
+        """Persistent web lookup cache, or None when disabled"""
+        if not self.use_lookup_cache:
+            return None
+        with self._session_lock:
+            if self._lookup_cache is None:
+                path = self.lookup_cache_path or os.path.join(self.project_folder, ".lookup_cache.sqlite")
+                self._lookup_cache = LookupCache(path, failure_ttl=self.failure_retry_hours * 3600)
+            return self._lookup_cache
+            
+    def search_image_urls(self, product_name):
+        """Candidate image URLs for a product, from the lookup cache or a web search"""
+        # Search query
+        search_query = f"{product_name} product image"
+        cache = self.get_lookup_cache()
+        if cache:
+            cached_urls = cache.get_search(search_query)
+            if cached_urls is not None:
+                self.metrics.count("search_cache_hit")
+                return cached_urls
+                
+        self.log(f"🔍 Searching web for: {product_name}")
+        search_url = self.search_url_template.format(query=urllib.parse.quote(search_query))
+        
+        # Get search results
+        response = self.http_get(search_url, timeout=10)
+        self.metrics.count("http_requests")
+        if response.status_code != 200:
+            response.close()
+            # Rate limits and server errors say nothing about the product; don't treat them as "no results"
+            raise Exception(f"search returned HTTP {response.status_code}")
+            
+        # Parse HTML to find image URLs
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(response.content, 'html.parser')
+        
+        # Find image elements
+        img_elements = soup.find_all('img')
+        
+        # Try to find actual image URLs from the page
+        image_urls = []
+        for img in img_elements:
+            src = img.get('src')
+            if src and src.startswith('http') and any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png']):
+                image_urls.append(src)
                 
-            # Parse HTML to find image URLs
-            soup = BeautifulSoup(response.content, 'html.parser')
+        # Also try to extract from data-src attributes
+        for img in img_elements:
+            data_src = img.get('data-src')
+            if data_src and data_src.startswith('http'):
+                image_urls.append(data_src)
+        
+        # If no direct URLs found, try alternative approach
+        if not image_urls:
+            # Look for specific patterns in Google Image search
+            scripts = soup.find_all('script')
+            for script in scripts:
+                if script.string and 'http' in str(script.string):
+                    # Extract URLs from JavaScript
+                    import re
+                    urls = re.findall(r'https?://[^\s"\']+\.(?:jpg|jpeg|png)', str(script.string))
+                    image_urls.extend(urls[:3])  # Take first 3 URLs
+                    if image_urls:
+                        break
+                        
+        image_urls = image_urls[:3]
+        if cache:
+            cache.put_search(search_query, image_urls)
+        return image_urls
+        
+    def download_image(self, url, image_path):
+        """Download url into image_path, reusing or revalidating an earlier download; returns the path or None"""
+        cache = self.get_lookup_cache()
+        cached = cache.get_download(url) if cache else None
+        if cached and not os.path.exists(cached["path"]):
+            cached = None
             
-            # Find image elements
-            img_elements = soup.find_all('img')
+        headers = {}
+        if cached:
+            if cached["fresh"]:
+                self.metrics.count("download_cache_hit")
+                return self.reuse_download(cached["path"], image_path)
+            # Ask the server whether our copy is still current
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+                
+        img_response = self.http_get(url, timeout=15, stream=True, headers=headers)
+        self.metrics.count("http_requests")
+        if cached and img_response.status_code == 304:
+            self.metrics.count("download_revalidated")
+            cache.put_download(url, cached["path"], cached["etag"], cached["last_modified"])
+            img_response.close()
+            return self.reuse_download(cached["path"], image_path)
+        if img_response.status_code != 200:
+            img_response.close()
+            if img_response.status_code in RETRY_STATUSES:
+                raise Exception(f"HTTP {img_response.status_code}")
+            return None
             
-            # Try to find actual image URLs from the page
-            image_urls = []
-            for img in img_elements:
-                src = img.get('src')
-                if src and src.startswith('http') and any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png']):
-                    image_urls.append(src)
-                    
-            # Also try to extract from data-src attributes
-            for img in img_elements:
-                data_src = img.get('data-src')
-                if data_src and data_src.startswith('http'):
-                    image_urls.append(data_src)
-            
-            # If no direct URLs found, try alternative approach
-            if not image_urls:
-                # Look for specific patterns in Google Image search
-                scripts = soup.find_all('script')
-                for script in scripts:
-                    if script.string and 'http' in str(script.string):
-                        # Extract URLs from JavaScript
-                        import re
-                        urls = re.findall(r'https?://[^\s"\']+\.(?:jpg|jpeg|png)', str(script.string))
-                        image_urls.extend(urls[:3])  # Take first 3 URLs
-                        if image_urls:
-                            break
+        # Verify it's actually an image
+        try:
+            with self.metrics.stage("download_decode"):
+                img = self.read_image_response(img_response)
+                self.save_normalized_image(img, image_path)
+        except Exception as e:
+            self.metrics.count("download_rejected")
+            self.log(f"⚠ Image processing failed: {e}")
+            return None
+        finally:
+            img_response.close()
+            
+        # Another product may already have this exact picture
+        self.link_duplicate(image_path)
+        if cache:
+            cache.put_download(url, image_path, img_response.headers.get("ETag"),
+                               img_response.headers.get("Last-Modified"))
+        return image_path
+        
+    def read_image_response(self, response):
+        """Read a streamed image response within the byte and pixel limits; raises ValueError when rejected"""
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and not content_type.lower().startswith("image/"):
+            raise ValueError(f"not an image ({content_type})")
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > self.max_download_bytes:
+            raise ValueError(f"{int(declared)} bytes exceeds the {self.max_download_bytes} byte limit")
+            
+        # Stop reading as soon as the body goes over the limit
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(64 * 1024):
+            buffer.write(chunk)
+            if buffer.tell() > self.max_download_bytes:
+                raise ValueError(f"body exceeds the {self.max_download_bytes} byte limit")
+        self.metrics.count("download_bytes", buffer.tell())
+        
+        # Opening only parses the header, so the pixel check happens before any decoding
+        buffer.seek(0)
+        img = Image.open(buffer)
+        width, height = img.size
+        if width * height > self.max_image_pixels:
+            raise ValueError(f"{width}x{height} exceeds the {self.max_image_pixels} pixel limit")
+        if img.format == "JPEG":
+            # Decode at 1/2, 1/4 or 1/8 scale when that still covers the target size
+            img.draft("RGB", (self.download_max_side, self.download_max_side))
+        img.load()
+        return img
+        
+    def save_normalized_image(self, img, image_path):
+        """Store a downloaded image as a JPEG no larger than download_max_side, keeping its aspect ratio"""
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        # Cells are at most a few hundred pixels, so this is enough for a clean LANCZOS resample later
+        img.thumbnail((self.download_max_side, self.download_max_side), Image.Resampling.LANCZOS)
+        # JPEG keeps the file small and lets the cell-resize step use draft decoding
+        temp_path = image_path + ".part"
+        img.save(temp_path, "JPEG", quality=90, optimize=True)
+        os.replace(temp_path, image_path)
+        
+    def reuse_download(self, cached_path, image_path):
+        """Copy (or hardlink, when deduplicating) an earlier download to this product's file name"""
+        if os.path.abspath(cached_path) == os.path.abspath(image_path):
+            return image_path
+        if self.dedupe_images:
+            temp_path = f"{image_path}.{os.getpid()}.link"
+            try:
+                os.link(cached_path, temp_path)
+                os.replace(temp_path, image_path)
+                return image_path
+            except OSError:
+                pass
+        shutil.copyfile(cached_path, image_path)
+        return image_path
+        
+    def search_and_download_image(self, product_name):
+        """Search for product image on the web and download it with exact product name
+
+        Returns (image_path, conclusive). image_path is None when nothing was saved;
+        conclusive is False when that was down to a network error, rate limit or
+        server error rather than the search finding no usable image.
+        """
+        transient = False
+        try:
+            image_urls = self.search_image_urls(product_name)
+            
+            # Save with EXACT product name (no cleaning for filename)
+            image_filename = f"{product_name}.jpg"
+            image_path = os.path.join(self.image_folder, image_filename)
             
             # Try to download the first few images
             for i, url in enumerate(image_urls[:3]):  # Try first 3 URLs
                 try:
-                    print(f"📥 Attempting to download image {i+1} for {product_name}")
-                    
-                    img_response = requests.get(url, headers=headers, timeout=15, stream=True)
-                    if img_response.status_code == 200:
+                    self.log(f"📥 Attempting to download image {i+1} for {product_name}")
+                    if self.download_image(url, image_path):
+                        self.get_image_index().add(image_path)
+                        self.log(f"✓ Downloaded and saved: {image_filename}")
+                        return image_path, True
                         
-                        # Verify it's actually an image
-                        try:
-                            img = Image.open(img_response.raw)
-                            
-                            # Convert to RGB if necessary
-                            if img.mode in ("RGBA", "P"):
-                                img = img.convert("RGB")
-                                
-                            # Resize to standard size for consistency
-                            img = img.resize((800, 800))  # Standard size for processing
-                            
-                            # Save with EXACT product name (no cleaning for filename)
-                            image_filename = f"{product_name}.jpg"
-                            image_path = os.path.join(self.image_folder, image_filename)
-                            
-                            img.save(image_path, "JPEG", quality=95)
-                            print(f"✓ Downloaded and saved: {image_filename}")
-                            
-                            return image_path
-                            
-                        except Exception as e:
-                            print(f"⚠ Image processing failed: {e}")
-                            continue
-                            
                 except Exception as e:
-                    print(f"⚠ Download failed for URL {i+1}: {e}")
+                    self.log(f"⚠ Download failed for URL {i+1}: {e}")
+                    transient = True
                     continue
                     
-            print(f"⚠ Could not download image for {product_name}")
-            return None
+            self.log(f"⚠ Could not download image for {product_name}")
+            return None, not transient
             
         except Exception as e:
-            print(f"⚠ Web search failed for {product_name}: {e}")
-            return None
+            self.log(f"⚠ Web search failed for {product_name}: {e}")
+            return None, False
+            
+    def get_placeholder_base(self):
+        """Shared placeholder background, border and caption, plus its font (built once)"""
+        with self._placeholder_lock:
+            if self._placeholder_base is None:
+                try:
+                    font = ImageFont.truetype("arial.ttf", 36)
+                except:
+                    font = ImageFont.load_default()
+                    
+                base = Image.new("RGB", (800, 800), color=(245, 245, 245))
+                draw = ImageDraw.Draw(base)
+                # Add border
+                draw.rectangle([(0, 0), (799, 799)], outline=(200, 200, 200), width=3)
+                # Add "Image Not Available" at bottom
+                draw.text((240, 720), "Image Not Available", fill=(150, 150, 150), font=font)
+                self._placeholder_base = (base, font)
+            return self._placeholder_base
             
-    def create_placeholder_image(self, product_name):
-        """Create enhanced placeholder image"""
+    def create_placeholder_image(self, product_name, size=800):
+        """Create enhanced placeholder image, resized to size x size"""
         try:
-            placeholder_img = Image.new("RGB", (800, 800), color=(245, 245, 245))
+            base, font = self.get_placeholder_base()
+            placeholder_img = base.copy()
             draw = ImageDraw.Draw(placeholder_img)
             
-            # Add border
-            draw.rectangle([(0, 0), (799, 799)], outline=(200, 200, 200), width=3)
-            
             # Split text to fit in image
-            words = product_name.split()
+            words = str(product_name).split()
             lines = []
             current_line = ""
             for word in words:
@@ -255,270 +1826,1174 @@ class ProductGridGenerator:
                 lines.append(current_line.strip())
                 
             # Center the text
-            try:
-                font = ImageFont.truetype("arial.ttf", 36)
-            except:
-                font = ImageFont.load_default()
-                
             y_start = 400 - (len(lines) * 25)
             for line in lines:
-                bbox = draw.textbbox((0, 0), line, font=font)
-                text_width = bbox[2] - bbox[0]
+                text_width, _ = self.text_layout.measure(font, line)
                 x_center = (800 - text_width) // 2
                 draw.text((x_center, y_start), line, fill=(100, 100, 100), font=font)
                 y_start += 50
                 
-            # Add "Image Not Available" at bottom
-            draw.text((240, 720), "Image Not Available", fill=(150, 150, 150), font=font)
-                
+            if size != 800:
+                placeholder_img = placeholder_img.resize((size, size), self.resample)
             return placeholder_img
             
         except Exception as e:
-            print(f"Error creating placeholder for {product_name}: {e}")
+            self.log(f"Error creating placeholder for {product_name}: {e}")
             return None
             
-    def process_product_images(self, df):
-        """Process all product images - find local, download missing, or create placeholders"""
-        print("\n🖼️ Processing Product Images...")
+    def acquire_web_image(self, product_name):
+        """Download a missing image or fall back to a placeholder; returns True if a real image was found"""
+        downloaded_path = None
+        cache = self.get_lookup_cache() if self.web_search else None
         
-        for index, row in df.iterrows():
-            product_name = row['Product Name']
-            print(f"\nProcessing: {product_name}")
-            
-            # First, try to find local image with exact name
-            local_image_path = self.find_local_image(product_name)
+        if cache and cache.should_skip(product_name):
+            # Failed recently; wait for the retry delay before searching again
+            self.log(f"⏭ Skipping web search for {product_name} (failed recently)")
+            self.metrics.count("lookup_failure_cached")
+        elif self.web_search:
+            with self.metrics.stage("download"):
+                downloaded_path, conclusive = self.search_and_download_image(product_name)
+                
+            if downloaded_path:
+                self.metrics.count("downloaded")
+                self.log(f"✓ Downloaded and saved web image")
+                if cache:
+                    cache.clear_failure(product_name)
+                return True
+                
+            self.metrics.count("download_failed")
+            # Only a search that ran and found nothing usable starts the retry delay
+            if cache and conclusive:
+                cache.record_failure(product_name)
             
-            if local_image_path:
-                df.at[index, 'Image_Found'] = True
-                print(f"✓ Using local image")
-                    
+        # Placeholders are drawn in memory at cell size, never saved as product images
+        self.log(f"Using placeholder for: {product_name}")
+        self.metrics.count("placeholder")
+        with self._placeholder_lock:
+            self.placeholders.add(product_name)
+        return False
+        
+    def process_product_images(self, df):
+        """Process all product images - find local, download missing, or mark placeholders"""
+        self.log("\n🖼️ Processing Product Images...")
+        with self.metrics.stage("image_index_refresh"):
+            self.get_image_index().refresh()
+        if self.dedupe_images and not self._content_index:
+            # First pass of the run: fold identical files already in the folder together
+            self.dedupe_image_folder()
+        
+        found = {}
+        missing = []
+        
+        # Local lookups are cheap, so resolve them up front without any delay
+        for product_name in df['Product Name'].unique():
+            if self.find_local_image(product_name):
+                found[product_name] = True
             else:
-                # Image not found locally, try to download from web
-                print(f"Local image not found for: {product_name}")
+                self.log(f"Local image not found for: {product_name}")
+                missing.append(product_name)
                 
-                downloaded_path = self.search_and_download_image(product_name)
+        # Fetch the misses concurrently; per-host pacing replaces the old fixed sleep
+        if missing:
+            workers = max(1, min(self.download_workers, len(missing)))
+            self.log(f"\n🌐 Fetching {len(missing)} images with {workers} workers")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for product_name, image_found in zip(missing, executor.map(self.acquire_web_image, missing)):
+                    found[product_name] = image_found
+                    
+        df['Image_Found'] = df['Product Name'].map(found).astype(bool)
+        self.log(f"\n✓ Completed image processing for {len(df)} products")
+        
+    def prepare_products(self, df):
+        """Build ProductRecords for a DataFrame of products with whole-column operations"""
+        import pandas as pd
+        with self.metrics.stage("prepare_products"):
+            names = df['Product Name'].astype(str)
+            
+            # "Name (quantity)" where a quantity is given
+            display_names = names
+            if 'Quantity' in df.columns:
+                quantities = df['Quantity']
+                display_names = names.where(quantities.isna(), names + " (" + quantities.astype(str) + ")")
                 
-                if downloaded_path:
-                    df.at[index, 'Image_Found'] = True
-                    print(f"✓ Downloaded and saved web image")
-                        
-                else:
-                    # Create placeholder and save it
-                    print(f"Creating placeholder for: {product_name}")
-                    placeholder = self.create_placeholder_image(product_name)
+            # "For/Price" for multi-buy offers, otherwise just the price
+            price_labels = df['Price'].astype(str)
+            if 'For' in df.columns:
+                for_values = pd.to_numeric(df['For'], errors='coerce')
+                multi_buy = for_values > 1
+                if multi_buy.any():
+                    counts = for_values[multi_buy].astype(int).astype(str)
+                    price_labels = price_labels.where(~multi_buy, counts + "/" + price_labels)
                     
-                    if placeholder:
-                        placeholder_filename = f"{product_name}.jpg"
-                        placeholder_path = os.path.join(self.image_folder, placeholder_filename)
-                        placeholder.save(placeholder_path, "JPEG", quality=95)
-                        
-                        df.at[index, 'Image_Found'] = False
-                        print(f"✓ Created and saved placeholder image")
-                    else:
-                        df.at[index, 'Image_Found'] = False
-                        print(f"✗ Failed to create placeholder")
+            index = self.get_image_index()
+            image_paths = [index.get(f"{name}.jpg") for name in names]
+            if 'Image_Found' in df.columns:
+                image_found = df['Image_Found'].astype(bool).tolist()
+            else:
+                image_found = [None] * len(df)
+                
+            return [ProductRecord(*fields) for fields in zip(names.tolist(), display_names.tolist(),
+                                                             price_labels.tolist(), image_paths, image_found)]
             
-            # Small delay to be respectful to web servers
-            time.sleep(1)
+    def get_thumbnail_cache(self):
+        """Persistent thumbnail cache, or None when disabled"""
+        if not self.use_thumbnail_cache:
+            return None
+        if self._thumbnail_cache is None:
+            folder = self.thumbnail_cache_folder or os.path.join(self.project_folder, ".thumbnail_cache")
+            self._thumbnail_cache = ThumbnailCache(folder, self.thumbnail_cache_max_mb * 1024 * 1024)
+        return self._thumbnail_cache
+        
+    def get_content_index(self):
+        """Persistent image content hashes, or None when deduplication is off"""
+        if not self.dedupe_images:
+            return None
+        with self._session_lock:
+            if self._content_index is None:
+                path = os.path.join(self.project_folder, ".image_hashes.sqlite")
+                self._content_index = ImageContentIndex(path, self.perceptual_dedupe)
+            return self._content_index
             
-        print(f"\n✓ Completed image processing for {len(df)} products")
+    def image_key(self, image_path):
+        """Identity of an image for the derivative caches: its content when deduplicating, else path and mtime"""
+        try:
+            image_stat = os.stat(image_path)
+        except OSError:
+            return None
+        stat_key = f"{os.path.abspath(image_path)}|{image_stat.st_mtime_ns}|{image_stat.st_size}"
+        index = self.get_content_index()
+        if index is None:
+            return stat_key
+        digest, dhash = index.lookup(image_path, stat_key)
+        # Near-identical pictures (same dHash and colours) share a derivative when perceptual matching is on
+        return f"dhash:{dhash}" if dhash else f"sha256:{digest}"
         
-    def split_text_to_fit(self, draw, text, font, max_width):
-        """Split text into multiple lines to fit width"""
-        words = text.split()
-        lines = []
-        current_line = ""
+    def link_duplicate(self, image_path):
+        """Replace image_path with a hardlink to an existing file of identical content; returns True if linked"""
+        index = self.get_content_index()
+        if index is None:
+            return False
+        try:
+            image_stat = os.stat(image_path)
+        except OSError:
+            return False
+        stat_key = f"{os.path.abspath(image_path)}|{image_stat.st_mtime_ns}|{image_stat.st_size}"
+        digest, _ = index.lookup(image_path, stat_key)
+        for other_path in index.paths_with_digest(digest):
+            try:
+                other_stat = os.stat(other_path)
+                if other_stat.st_ino == image_stat.st_ino and other_stat.st_dev == image_stat.st_dev:
+                    continue
+                # Still the same bytes as when it was hashed?
+                other_key = f"{os.path.abspath(other_path)}|{other_stat.st_mtime_ns}|{other_stat.st_size}"
+                if index.lookup(other_path, other_key)[0] != digest:
+                    continue
+                temp_path = f"{image_path}.{os.getpid()}.link"
+                os.link(other_path, temp_path)
+                os.replace(temp_path, image_path)
+            except OSError:
+                continue
+            # The hardlink has the other file's mtime, so record it under its new stat key
+            self.image_key(image_path)
+            self.metrics.count("images_linked")
+            self.metrics.count("image_bytes_saved", image_stat.st_size)
+            return True
+        return False
         
-        for word in words:
-            test_line = current_line + (word + " ")
-            line_bbox = draw.textbbox((0, 0), test_line, font=font)
-            line_width = line_bbox[2] - line_bbox[0]
+    def dedupe_image_folder(self):
+        """Hardlink byte-identical files in the image folder together"""
+        index = self.get_image_index()
+        index.refresh()
+        linked = 0
+        with self.metrics.stage("image_dedupe"):
+            for image_path in sorted(index.paths()):
+                if self.link_duplicate(image_path):
+                    linked += 1
+        if linked:
+            self.log(f"✓ Linked {linked} duplicate images to shared files")
+        return linked
+        
+    def get_tile_atlas(self):
+        """Tile atlas for the current layout, or None when disabled"""
+        if not self.use_tile_atlas:
+            return None
+        if self._tile_atlas is None:
+            folder = self.tile_atlas_folder or os.path.join(self.project_folder, ".tile_atlas")
+            self._tile_atlas = TileAtlas(folder, json.dumps(self.layout_params(), sort_keys=True))
+        return self._tile_atlas
+        
+    def build_tile_atlas(self, products):
+        """Add tiles for products whose cell image is not in the atlas yet (parent process only)"""
+        atlas = self.get_tile_atlas()
+        if atlas is None:
+            return
+        if self._atlas_fonts is None:
+            atlas.open_for_build()
+            self.compact_tile_atlas(atlas)
+            self._atlas_fonts = self.load_fonts()
+        _, product_font, _, _ = self._atlas_fonts
+        cell_width, cell_height = self.cell_size()
+        
+        added = 0
+        with self.metrics.stage("tile_atlas_build"):
+            for product in products:
+                if not product.image_path:
+                    continue
+                img_size = self.product_image_size(product, product_font, cell_width, cell_height)
+                image_key = self.image_key(product.image_path)
+                if (image_key, img_size) in atlas:
+                    continue
+                try:
+                    atlas.add(image_key, img_size, self.load_cell_image(product.image_path, img_size))
+                    added += 1
+                except Exception as e:
+                    self.log(f"⚠ Could not add {product.name} to the tile atlas: {e}")
+        if added:
+            self.metrics.count("tile_atlas_added", added)
+            self.log(f"✓ Added {added} tiles to the atlas ({len(atlas)} total)")
             
-            if line_width <= max_width:
-                current_line = test_line
-            else:
-                lines.append(current_line.strip())
-                current_line = word + " "
+    def compact_tile_atlas(self, atlas):
+        """Drop tiles of images that changed or left the image folder once they make up too much of the atlas"""
+        live_sources = {self.image_key(image_path) for image_path in self.get_image_index().paths()}
+        with self.metrics.stage("tile_atlas_compact"):
+            dropped = atlas.compact(live_sources, self.tile_atlas_max_dead_share)
+        if dropped:
+            self.metrics.count("tile_atlas_dropped", dropped)
+            self.log(f"✓ Compacted the tile atlas: dropped {dropped} stale tiles ({len(atlas)} kept)")
+            
+    def load_cell_image(self, image_path, img_size):
+        """Load an image resized to img_size x img_size, from the tile atlas or thumbnail cache when possible"""
+        image_key = self.image_key(image_path)
+        if self.dedupe_images or self.warm_derivatives:
+            # Products sharing an image's content share one decoded derivative
+            with self._derivatives_lock:
+                img = self._derivatives.get((image_key, img_size))
+                if img is not None:
+                    self._derivatives.move_to_end((image_key, img_size))
+                    self.metrics.count("derivative_shared")
+                    return img
+            img = self.load_derivative(image_path, image_key, img_size)
+            with self._derivatives_lock:
+                self._derivatives[(image_key, img_size)] = img
+                while len(self._derivatives) > self.derivative_memory_entries:
+                    self._derivatives.popitem(last=False)
+            return img
+        return self.load_derivative(image_path, image_key, img_size)
+        
+    def load_derivative(self, image_path, image_key, img_size):
+        """Resized image from the tile atlas, the thumbnail cache or a fresh decode"""
+        atlas = self.get_tile_atlas()
+        if atlas is not None:
+            img = atlas.get(image_key, img_size)
+            if img is not None:
+                self.metrics.count("tile_atlas_hit")
+                return img
                 
-        if current_line:
-            lines.append(current_line.strip())
+        cache = self.get_thumbnail_cache()
+        if cache:
+            with self.metrics.stage("thumbnail_cache_read"):
+                img = cache.get(image_key, img_size)
+            if img is not None:
+                self.metrics.count("thumbnail_cache_hit")
+                return img
+            self.metrics.count("thumbnail_cache_miss")
             
-        return lines
+        with self.metrics.stage("image_decode_resize"):
+            img = Image.open(image_path)
+            if img.format == "JPEG":
+                # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 before the final resample
+                img.draft("RGB", (img_size, img_size))
+            img = img.resize((img_size, img_size), self.resample)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            
+        if cache:
+            cache.put(image_key, img_size, img)
+        return img
         
-    def draw_header(self, draw, a4_width, header_font, header_attr_font):
-        """Draw page header with proper date formatting"""
-        current_date = datetime.now()
+    def split_text_to_fit(self, draw, text, font, max_width):
+        """Split text into multiple lines to fit width"""
+        return [line for line, _, _ in self.wrap_text(font, text, max_width)]
+        
+    def header_texts(self):
+        """Sub-header texts: the dated price period and the store address"""
+        current_date = self.effective_date or datetime.now()
         date_from = current_date.strftime("%b %d")
         end_date = current_date + timedelta(days=6)
         date_to = end_date.strftime("%b %d, %Y")
         
         left_text = f"Price effective from {date_from} {current_date.year} to {date_to}"
-        right_text = "100 Railroad Avenue, Denmark, WI, United States, Wisconsin"
+        right_text = self.store_address
+        return left_text, right_text
+        
+    def draw_header(self, draw, a4_width, header_font, header_attr_font):
+        """Draw page header with proper date formatting"""
+        left_text, right_text = self.header_texts()
+        layout = self.layout
         
-        header_text = "Main Street\nMarket"
-        header_text_bbox = draw.textbbox((0, 0), header_text, font=header_font)
-        header_text_width = header_text_bbox[2] - header_text_bbox[0]
+        header_text = self.store_title
+        header_text_width, _ = self.text_layout.measure(header_font, header_text)
         
         max_text_width = header_text_width
+        reference_width = None
+        if header_font in self._reference_fonts:
+            reference_width, _ = self.text_layout.measure(self._reference_fonts[header_font], header_text)
         
-        left_lines = self.split_text_to_fit(draw, left_text, header_attr_font, max_text_width)
-        right_lines = self.split_text_to_fit(draw, right_text, header_attr_font, max_text_width)
+        left_lines = self.wrap_text(header_attr_font, left_text, max_text_width, reference_width)
+        right_lines = self.wrap_text(header_attr_font, right_text, max_text_width, reference_width)
         
-        padding_x = 40
-        y_offset_left = 140
-        y_offset_right = 140
+        padding_x = layout.subheader_margin
+        y_offset_left = layout.subheader_top
+        y_offset_right = layout.subheader_top
         
-        for line in left_lines:
+        for line, _, _ in left_lines:
             draw.text((padding_x, y_offset_left), line, font=header_attr_font, fill=(0, 0, 0))
-            y_offset_left += 35
+            y_offset_left += layout.subheader_line
             
-        for line in right_lines:
-            right_text_bbox = draw.textbbox((0, 0), line, font=header_attr_font)
-            text_width = right_text_bbox[2] - right_text_bbox[0]
+        for line, text_width, _ in right_lines:
             draw.text((a4_width - text_width - padding_x, y_offset_right), line, font=header_attr_font, fill=(0, 0, 0))
-            y_offset_right += 35
+            y_offset_right += layout.subheader_line
             
+    def needs_placeholder(self, product):
+        """True for products whose image acquisition ended with a placeholder"""
+        if product.image_found is None:
+            return product.name in self.placeholders
+        return not product.image_found
+        
+    def cell_image_size(self, text_bottom, cell_width, cell_height):
+        """Side of the square product image below a name banner ending text_bottom pixels into the cell"""
+        # Calculate available space for image
+        available_width = cell_width - self.layout.image_margin  # Small margins
+        available_height = cell_height - text_bottom - self.layout.price_space  # Leave space for price
+        # Use 95% of available area
+        img_size = int(min(available_width, available_height) * 0.95)
+        # Ensure minimum size for visibility
+        if img_size < self.layout.image_min:
+            img_size = min(self.layout.image_min, available_width, available_height)
+        return img_size
+        
+    def product_image_size(self, product, product_font, cell_width, cell_height):
+        """Image size draw_product_cell will use for this product"""
+        layout = self.layout
+        lines = self.wrap_text(product_font, product.display_name, layout.name_width,
+                               layout.reference().name_width)
+        text_height = sum(line_height + layout.line_gap for _, _, line_height in lines)
+        return self.cell_image_size(layout.name_top + text_height, cell_width, cell_height)
+        
     def draw_product_cell(self, draw, grid_image, x, y, product, product_font, price_font, cell_width, cell_height):
         """Draw individual product cell with MUCH LARGER images that fill most of the cell"""
-        product_name = product["Product Name"]
-        quantity = product.get("Quantity")
+        product_name = product.name
+        display_name = product.display_name
+        layout = self.layout
         
-        display_name = product_name
-        if pd.notna(quantity):
-            display_name += f" ({quantity})"
-            
-        max_text_width = cell_width - 40
-        product_lines = self.split_text_to_fit(draw, display_name, product_font, max_text_width)
+        max_text_width = layout.name_width
+        with self.metrics.stage("text_layout"):
+            product_lines = self.wrap_text(product_font, display_name, max_text_width,
+                                           layout.reference().name_width)
+        
+        # Cell border; one template serves every page, so only used cells get one
+        left, top = x + layout.border_inset, y + layout.border_inset
+        right = x + cell_width - layout.border_trim
+        bottom = y + cell_height - layout.border_trim
+        draw.rectangle([(left, top), (right, bottom)], fill=None, outline=(200, 200, 200), width=layout.border_width)
         
         # Draw green background for product name - smaller to leave more room for image
-        text_y = y + 15
-        highlight_padding = 10
+        text_x = x + layout.name_left
+        text_y = y + layout.name_top
+        highlight_padding = layout.name_padding
         
         # Calculate total height needed for all lines
         total_text_height = 0
-        for line in product_lines:
-            line_bbox = draw.textbbox((0, 0), line, font=product_font)
-            total_text_height += (line_bbox[3] - line_bbox[1]) + 10
+        for _, _, line_height in product_lines:
+            total_text_height += line_height + layout.line_gap
         
         # Draw green background rectangle
         bg_width = max_text_width + (highlight_padding * 2)
-        draw.rectangle([(x + 20 - highlight_padding, text_y - highlight_padding),
-                       (x + 20 + bg_width, text_y + total_text_height + highlight_padding)],
+        draw.rectangle([(text_x - highlight_padding, text_y - highlight_padding),
+                       (text_x + bg_width, text_y + total_text_height + highlight_padding)],
                       fill=(34, 139, 34))  # Forest green color
         
+        # The banner covers the top of the cell border; restore it on top
+        stroke = layout.border_width - 1
+        banner_bottom = min(text_y + total_text_height + highlight_padding, bottom)
+        draw.rectangle([(left, top), (right, top + stroke)], fill=(200, 200, 200))
+        draw.rectangle([(left, top), (left + stroke, banner_bottom)], fill=(200, 200, 200))
+        draw.rectangle([(right - stroke, top), (right, banner_bottom)], fill=(200, 200, 200))
+        
         # Draw product name text in white
         current_y = text_y
-        for line in product_lines:
-            draw.text((x + 20, current_y), line, font=product_font, fill=(255, 255, 255))
-            line_bbox = draw.textbbox((0, 0), line, font=product_font)
-            current_y += (line_bbox[3] - line_bbox[1]) + 10
+        for line, _, line_height in product_lines:
+            draw.text((text_x, current_y), line, font=product_font, fill=(255, 255, 255))
+            current_y += line_height + layout.line_gap
             
         # Load and draw image - MUCH LARGER to fill most of the cell
-        image_path = os.path.join(self.image_folder, f"{product_name}.jpg")
+        image_path = product.image_path
+        use_placeholder = not image_path and self.needs_placeholder(product)
         
-        if os.path.exists(image_path):
+        if image_path or use_placeholder:
             try:
-                img = Image.open(image_path)
-                # Calculate available space for image
-                available_width = cell_width - 60  # Small margins
-                available_height = cell_height - (current_y - y) - 140  # Leave space for price (less than before)
-                # Use 95% of available area
-                img_size = int(min(available_width, available_height) * 0.95)
-                # Ensure minimum size for visibility
-                if img_size < 180:
-                    img_size = min(180, available_width, available_height)
-                img = img.resize((img_size, img_size), Image.Resampling.LANCZOS)
+                img_size = self.cell_image_size(current_y - y, cell_width, cell_height)
+                if use_placeholder:
+                    with self.metrics.stage("placeholder"):
+                        img = self.create_placeholder_image(product_name, img_size)
+                else:
+                    img = self.load_cell_image(image_path, img_size)
                 img_x = x + (cell_width - img_size) // 2
-                img_y = current_y + 20
+                img_y = current_y + layout.image_gap
                 grid_image.paste(img, (img_x, img_y))
-                print(f"✓ Placed LARGE image for {product_name} at size {img_size}x{img_size}")
+                if self.verbose:
+                    self.log(f"✓ Placed LARGE image for {product_name} at size {img_size}x{img_size}")
             except Exception as e:
-                print(f"Error loading image for {product_name}: {e}")
+                self.log(f"Error loading image for {product_name}: {e}")
                 
         # Draw price at bottom right
-        price = str(product["Price"])
-        for_value = product.get("For", 1)
-        
-        if pd.notna(for_value) and for_value > 1:
-            price = f"{int(for_value)}/{price}"
-            
-        price_bbox = draw.textbbox((0, 0), price, font=price_font)
-        price_text_width = price_bbox[2] - price_bbox[0]
+        price = product.price_label
+        price_text_width, _ = self.text_layout.measure(price_font, price)
         
         # Position price at bottom right
-        price_x = x + cell_width - price_text_width - 40
-        price_y = y + cell_height - 120
+        price_x = x + cell_width - price_text_width - layout.price_right
+        price_y = y + cell_height - layout.price_bottom
         draw.text((price_x, price_y), price, font=price_font, fill=(0, 0, 0))
         
-        # Draw cell border
-        draw.rectangle([(x + 10, y + 10), (x + cell_width - 30, y + cell_height - 30)], 
-                      fill=None, outline=(200, 200, 200), width=3)
+        # Large price glyphs can dip into the bottom border; restore it on top
+        draw.rectangle([(left, bottom - stroke), (right, bottom)], fill=(200, 200, 200))
+        
 
-    def create_grid_page(self, page_number, products, fonts):
-        """Create a single grid page with optimized dimensions matching your reference image"""
-        header_font, product_font, price_font, header_attr_font = fonts
+    def cell_size(self):
+        """(width, height) of one grid cell"""
+        return self.layout.cell_width, self.layout.cell_height
+        
+    def cell_origin(self, idx, cell_width, cell_height):
+        """Top-left corner of the idx-th cell in the grid"""
+        col = idx % self.layout.columns
+        row = idx // self.layout.columns
+        return col * cell_width + self.layout.grid_left, row * cell_height + self.layout.grid_top  # Below the header
         
-        # Optimized A4 dimensions - more reasonable size but high quality
-        a4_width = 3508   # A4 width at 300 DPI
-        a4_height = 4961  # A4 height at 300 DPI
-        cell_width = a4_width // 3
-        cell_height = (a4_height - 400) // 4  # Adjusted for header
+    def get_page_template(self, fonts):
+        """Static page layer (title and dated sub-header) for the current header; cells draw their own borders"""
+        header_font, _, _, header_attr_font = fonts
+        day = (self.effective_date or datetime.now()).strftime("%Y-%m-%d")
+        key = (day, fonts, self.store_title, self.store_address)
+        template = self._page_templates.get(key)
+        if template is not None:
+            return template
+            
+        # Only the current header's template is kept: each one is a full-page buffer
+        self._page_templates = {}
+        
+        layout = self.layout
+        a4_width = layout.width
+        a4_height = layout.height
         
-        grid_image = Image.new("RGB", (a4_width, a4_height), color=(255, 255, 255))
-        draw = ImageDraw.Draw(grid_image)
+        template = Image.new("RGB", (a4_width, a4_height), color=(255, 255, 255))
+        draw = ImageDraw.Draw(template)
         
         # Draw main header
-        header_text = "Main Street\nMarket"
-        header_text_bbox = draw.textbbox((0, 0), header_text, font=header_font)
-        header_text_width = header_text_bbox[2] - header_text_bbox[0]
-        draw.text(((a4_width - header_text_width) // 2, 80), header_text, font=header_font, fill=(0, 0, 0))
+        header_text = self.store_title
+        header_text_width, _ = self.text_layout.measure(header_font, header_text)
+        draw.text(((a4_width - header_text_width) // 2, layout.title_top), header_text, font=header_font, fill=(0, 0, 0))
         
         # Draw sub-header
         self.draw_header(draw, a4_width, header_font, header_attr_font)
         
-        # Draw products in 3x4 grid
-        for idx, product in enumerate(products):
-            if idx >= 12:
-                break
+        self._page_templates[key] = template
+        return template
+        
+    def page_budget(self):
+        """Number of full-page buffers that fit in memory_budget_mb, or None when unlimited"""
+        if not self.memory_budget_mb:
+            return None
+        page_bytes = self.layout.width * self.layout.height * 3
+        return max(1, int(self.memory_budget_mb * 1024 * 1024 // page_bytes))
+        
+    def get_canvas_pool(self):
+        """Shared pool of page canvases sized from the memory budget"""
+        if self._canvas_pool is None:
+            budget = self.page_budget()
+            # The page template takes one buffer of the budget
+            capacity = budget - 1 if budget else self.encode_queue_size + 1
+            self._canvas_pool = CanvasPool((self.layout.width, self.layout.height), capacity)
+        return self._canvas_pool
+        
+    def render_grid_page(self, products, fonts, pooled=True):
+        """Draw a single grid page and return the canvas (from the canvas pool unless pooled=False)"""
+        header_font, product_font, price_font, header_attr_font = fonts
+        
+        cell_width, cell_height = self.cell_size()
+        atlas = self.get_tile_atlas()
+        if atlas is not None:
+            # Pick up tiles the parent added since the last page
+            atlas.refresh()
+        
+        with self.metrics.stage("page_render"):
+            # Start from a copy of the prerendered header
+            if len(products) > self.layout.cells_per_page:
+                raise ValueError(f"{len(products)} products do not fit a {self.layout.columns}x{self.layout.rows} page")
+            template = self.get_page_template(fonts)
+            if pooled:
+                # Pasting the template overwrites whatever the reused buffer held
+                grid_image = self.get_canvas_pool().acquire()
+            else:
+                grid_image = template.copy()
+            try:
+                if pooled:
+                    grid_image.paste(template)
+                draw = ImageDraw.Draw(grid_image)
                 
-            col = idx % 3
-            row = idx // 3
-            
-            x = col * cell_width + 20
-            y = row * cell_height + 300  # Adjusted for header
-            
-            self.draw_product_cell(draw, grid_image, x, y, product, product_font, price_font, cell_width, cell_height)
-            
-        # Save with high quality
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file_path = os.path.join(self.output_folder, f"product_grid_{current_time}_page_{page_number}.jpg")
+                # Draw products in the grid
+                for idx, product in enumerate(products):
+                    x, y = self.cell_origin(idx, cell_width, cell_height)
+                    self.draw_product_cell(draw, grid_image, x, y, product, product_font, price_font,
+                                           cell_width, cell_height)
+            except BaseException:
+                # A failed page must not keep its pooled canvas, or later pages block in acquire()
+                if pooled:
+                    self.get_canvas_pool().release(grid_image)
+                raise
+                
+        self.metrics.count("pages_rendered")
+        return grid_image
+        
+    def page_output_path(self, page_number, run_stamp=None):
+        """Output file for a single page in the configured format"""
+        current_time = run_stamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = PAGE_FORMATS[self.page_format][0]
+        return os.path.join(self.output_folder, f"{self.output_prefix()}_{current_time}_page_{page_number}{extension}")
+        
+    def output_prefix(self):
+        """File name prefix for this run's outputs; drafts are kept apart from final pages"""
+        return "product_grid_draft" if self.draft else "product_grid"
         
+    def owns_output(self, file_name):
+        """True for a page file named with this run's output prefix (followed directly by its run stamp)"""
+        prefix = f"{self.output_prefix()}_"
+        return file_name.startswith(prefix) and file_name[len(prefix):][:1].isdigit()
+        
+    def create_grid_page(self, page_number, products, fonts, run_stamp=None, encoder=None):
+        """Create a single grid page with optimized dimensions matching your reference image"""
+        grid_image = self.render_grid_page(products, fonts)
+        
+        if encoder:
+            # Pages bound for the combined PDF have no file of their own
+            output_file_path = None if encoder.page_format == "pdf" else self.page_output_path(page_number, run_stamp)
+            encoder.submit(grid_image, output_file_path)
+            self.log(f"✓ Created OPTIMIZED grid page {page_number}")
+            return output_file_path
+            
         # Save with high quality and good DPI
-        grid_image.save(output_file_path, "JPEG", quality=95, dpi=(300, 300))
-        print(f"✓ Created OPTIMIZED grid page {page_number} -> {output_file_path}")
+        output_file_path = self.page_output_path(page_number, run_stamp)
+        try:
+            with self.metrics.stage("page_encode"):
+                save_page_image(grid_image, output_file_path, self.page_format, dpi=self.layout.dpi)
+        finally:
+            self.get_canvas_pool().release(grid_image)
+        self.log(f"✓ Created OPTIMIZED grid page {page_number} -> {output_file_path}")
         
         return output_file_path
         
+    def open_page_encoder(self, run_stamp):
+        """Background encoder for this run, with the PDF and zip bundle paths when enabled"""
+        pdf_path = None
+        zip_path = None
+        if self.page_format == "pdf":
+            pdf_path = os.path.join(self.output_folder, f"{self.output_prefix()}_{run_stamp}.pdf")
+        if self.zip_bundle:
+            zip_path = os.path.join(self.output_folder, f"{self.output_prefix()}_{run_stamp}.zip")
+        return PageEncoder(self.page_format, pdf_path, zip_path, self.encode_queue_size, self.metrics,
+                           self.get_canvas_pool(), self.layout.dpi)
+        
+    def finish_outputs(self, output_files, encoder):
+        """Final output list: the page files, or the combined PDF"""
+        if encoder.pdf_path:
+            self.log(f"✓ Wrote {encoder.pdf_pages}-page PDF -> {encoder.pdf_path}")
+            output_files = [encoder.pdf_path]
+        if encoder.zip_path:
+            self.log(f"✓ Wrote bundle -> {encoder.zip_path}")
+        return output_files
+        
     def generate_all_grids(self, df):
         """Generate all grid pages and remove duplicates"""
         # Remove duplicate products based on Product Name
-        print(f"Original products: {len(df)}")
+        self.log(f"Original products: {len(df)}")
         df_unique = df.drop_duplicates(subset=['Product Name'], keep='first')
-        print(f"After removing duplicates: {len(df_unique)}")
+        self.log(f"After removing duplicates: {len(df_unique)}")
+        self.get_image_index().refresh()
+        products = self.prepare_products(df_unique)
+        self.build_tile_atlas(products)
         
-        fonts = self.load_fonts()
+        items_per_page = self.layout.cells_per_page
+        # One timestamp per run so every page shares a deterministic file name prefix
+        run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pages = []
+        for i in range(0, len(products), items_per_page):
+            product_batch = products[i:i + items_per_page]
+            page_number = (i // items_per_page) + 1
+            pages.append((page_number, product_batch))
+            
+        incremental = self.incremental and self.page_format != "pdf"
+        if self.incremental and not incremental:
+            self.log("⚠ Incremental builds need per-page files; rendering every page into the PDF")
+            
+        encoder = self.open_page_encoder(run_stamp)
+        try:
+            if not incremental:
+                output_files = self.render_pages(pages, run_stamp, encoder)
+            else:
+                # Reuse outputs of pages whose content hash matches the last build
+                manifest = self.load_build_manifest()
+                fingerprint = self.build_fingerprint()
+                page_hashes = {}
+                reused = {}
+                for page_number, product_batch in pages:
+                    page_hash = self.page_content_hash(product_batch, fingerprint)
+                    page_hashes[page_number] = page_hash
+                    existing = self.manifest_output(manifest, page_number, page_hash)
+                    if existing:
+                        reused[page_number] = existing
+                        
+                self.log(f"♻ Reusing {len(reused)} unchanged pages, rendering {len(pages) - len(reused)}")
+                # Reused pages reach the encoder (and the zip) in page order with the rendered ones
+                output_files = self.render_pages(pages, run_stamp, encoder, reused)
+        finally:
+            encoder.close()
+            
+        if incremental:
+            self.save_build_manifest(page_hashes, dict(zip(page_hashes, output_files)))
+        return self.finish_outputs(output_files, encoder)
         
-        items_per_page = 12
+    def render_pages(self, pages, run_stamp, encoder, reused=None):
+        """Render (page_number, products) pages in order, in parallel when configured
+
+        Pages in reused ({page_number: existing file}) are not rendered; their files
+        go to the encoder in page order between the rendered ones.
+        """
+        reused = reused or {}
+        if self.render_workers > 1 and len(pages) - len(reused) > 1:
+            return self.render_pages_parallel(pages, run_stamp, encoder, reused)
+            
+        if not pages:
+            return []
+        fonts = self.load_fonts() if len(pages) > len(reused) else None
         output_files = []
         
-        for i in range(0, len(df_unique), items_per_page):
-            product_batch = df_unique.iloc[i:i + items_per_page].to_dict(orient='records')
-            page_number = (i // items_per_page) + 1
-            output_file = self.create_grid_page(page_number, product_batch, fonts)
+        for page_number, product_batch in pages:
+            if page_number in reused:
+                output_files.extend(self.submit_rendered([(page_number, reused[page_number])], encoder))
+                continue
+            output_file = self.create_grid_page(page_number, product_batch, fonts, run_stamp, encoder)
             output_files.append(output_file)
             
         return output_files
         
+    def build_manifest_path(self):
+        """Manifest of the last incremental build with this run's output prefix; drafts keep their own"""
+        suffix = self.output_prefix()[len("product_grid"):]
+        return os.path.join(self.output_folder, f"build_manifest{suffix}.json")
+        
+    def load_build_manifest(self):
+        """Pages recorded by the previous incremental build: {page_number: {"hash", "file"}}"""
+        try:
+            with open(self.build_manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f).get("pages", {})
+        except (OSError, ValueError):
+            return {}
+            
+    def save_build_manifest(self, page_hashes, output_files):
+        """Record this build and delete outputs the new manifest no longer references"""
+        previous = self.load_build_manifest()
+        pages = {str(page_number): {"hash": page_hashes[page_number],
+                                    "file": os.path.basename(output_files[page_number])}
+                 for page_number in page_hashes}
+        
+        kept = {entry["file"] for entry in pages.values()}
+        for entry in previous.values():
+            # Never touch another kind of build's pages (final vs draft)
+            if entry.get("file") and entry["file"] not in kept and self.owns_output(entry["file"]):
+                try:
+                    os.remove(os.path.join(self.output_folder, entry["file"]))
+                except OSError:
+                    pass
+                    
+        manifest_path = self.build_manifest_path()
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "pages": pages}, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        
+    def manifest_output(self, manifest, page_number, page_hash):
+        """Existing output file for a page if its hash is unchanged, else None"""
+        entry = manifest.get(str(page_number))
+        if not entry or entry.get("hash") != page_hash:
+            return None
+        output_path = os.path.join(self.output_folder, entry["file"])
+        return output_path if os.path.exists(output_path) else None
+        
+    def layout_params(self):
+        """Font and geometry settings that decide where and how large cells are drawn"""
+        font = None
+        if self.font_path and os.path.exists(self.font_path):
+            font_stat = os.stat(self.font_path)
+            font = [os.path.abspath(self.font_path), font_stat.st_size, font_stat.st_mtime_ns]
+        params = self.layout.params()
+        params.update({"font": font, "resample": int(self.resample)})
+        return params
+        
+    def build_fingerprint(self):
+        """Digest of everything besides the products that page output depends on"""
+        params = self.layout_params()
+        params.update({
+            "format": self.page_format,
+            "title": self.store_title,
+            "header": list(self.header_texts()),
+        })
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+        
+    def page_content_hash(self, products, fingerprint):
+        """Hash of a page's product labels, their image fingerprints and the build fingerprint"""
+        digest = hashlib.sha256(fingerprint.encode("utf-8"))
+        for product in products:
+            row = {"name": product.name, "display_name": product.display_name,
+                   "price_label": product.price_label, "image_found": product.image_found}
+            if product.image_path:
+                try:
+                    image_stat = os.stat(product.image_path)
+                    row["image"] = [image_stat.st_size, image_stat.st_mtime_ns]
+                except OSError:
+                    pass
+            digest.update(json.dumps(row, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+        
+    def render_worker_settings(self):
+        """Settings copied into each render worker process"""
+        return {
+            'project_folder': self.project_folder,
+            'image_folder': self.image_folder,
+            'output_folder': self.output_folder,
+            'font_path': self.font_path,
+            'page_format': self.page_format,
+            'memory_budget_mb': self.memory_budget_mb,
+            'verbose': self.verbose,
+            'effective_date': self.effective_date,
+            'store_title': self.store_title,
+            'store_address': self.store_address,
+            'use_thumbnail_cache': self.use_thumbnail_cache,
+            'thumbnail_cache_folder': self.thumbnail_cache_folder,
+            'thumbnail_cache_max_mb': self.thumbnail_cache_max_mb,
+            'use_tile_atlas': self.use_tile_atlas,
+            'dedupe_images': self.dedupe_images,
+            'perceptual_dedupe': self.perceptual_dedupe,
+            'layout': self.layout,
+            'draft': self.draft,
+            'resample': self.resample,
+            'tile_atlas_folder': self.tile_atlas_folder,
+        }
+        
+    def parallel_limits(self):
+        """(worker processes, batches in flight, pages per batch) allowed by render_workers and the memory budget"""
+        workers = self.render_workers
+        pages_per_batch = max(1, self.pages_per_batch)
+        budget = self.page_budget()
+        if not budget:
+            return workers, workers * 2, pages_per_batch
+        # Each worker holds a page template and a canvas
+        workers = max(1, min(workers, budget // 2))
+        if self.page_format == "pdf":
+            # PDF workers send whole canvases back, so every batch in flight is held by this process;
+            # single-page batches leave room for the page being appended and one queued for the encoder
+            max_pending = max(1, budget - 2)
+            return min(workers, max_pending), max_pending, 1
+        return workers, workers * 2, pages_per_batch
+        
+    def render_pages_parallel(self, pages, run_stamp, encoder, reused=None):
+        """Render page batches across a process pool, keeping page order (reused pages are queued as finished)"""
+        reused = reused or {}
+        workers, max_pending, batch_size = self.parallel_limits()
+        # Batches of consecutive pages to render, with reused pages as finished items in between
+        items = []
+        batch = []
+        for page_number, product_batch in pages:
+            if page_number in reused:
+                if batch:
+                    items.append((run_stamp, batch))
+                    batch = []
+                items.append([(page_number, reused[page_number])])
+                continue
+            batch.append((page_number, product_batch))
+            if len(batch) == batch_size:
+                items.append((run_stamp, batch))
+                batch = []
+        if batch:
+            items.append((run_stamp, batch))
+        workers = min(workers, sum(1 for item in items if isinstance(item, tuple)))
+        self.log(f"🚀 Rendering {len(pages) - len(reused)} pages with {workers} worker processes")
+        
+        output_files = []
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_render_worker,
+                                 initargs=(self.render_worker_settings(),)) as executor:
+            # Submit a bounded window of batches and collect them in order
+            for item in items:
+                if isinstance(item, list):
+                    # Already finished: queue it behind pending renders to keep page order
+                    pending.append(item)
+                else:
+                    pending.append(executor.submit(_render_page_batch, item))
+                while len(pending) >= max_pending:
+                    output_files.extend(self._collect_pending(pending.popleft(), encoder))
+            while pending:
+                output_files.extend(self._collect_pending(pending.popleft(), encoder))
+                
+        return output_files
+        
+    def submit_rendered(self, rendered, encoder):
+        """Pass worker results (a saved page path, or a canvas for the PDF) to the encoder"""
+        output_files = []
+        for page_number, result in rendered:
+            if isinstance(result, str):
+                encoder.submit(None, result)
+                output_files.append(result)
+            else:
+                encoder.submit(result, None)
+                output_files.append(None)
+        return output_files
+        
+    def validate_columns(self, df):
+        """Raise if the CSV is missing required columns"""
+        required_columns = ['Product Name', 'Price']
+        missing_cols = [col for col in required_columns if col not in df.columns]
+        if missing_cols:
+            raise Exception(f"Missing required columns: {missing_cols}")
+            
+    def iter_product_pages(self, csv_path, items_per_page=None):
+        """Yield pages of unique products while reading the CSV in chunks"""
+        items_per_page = items_per_page or self.layout.cells_per_page
+        # 8-byte digests keep the seen-set small for very large feeds
+        import pandas as pd
+        seen = set()
+        page = []
+        rows = 0
+        
+        try:
+            chunks = pd.read_csv(csv_path, chunksize=self.csv_chunk_size)
+        except Exception as e:
+            raise Exception(f"Error reading CSV file: {e}")
+            
+        while True:
+            with self.metrics.stage("csv_load"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if rows == 0:
+                self.validate_columns(chunk)
+            rows += len(chunk)
+            
+            self.metrics.count("csv_rows", len(chunk))
+            for product in chunk.to_dict(orient='records'):
+                key = hashlib.blake2b(str(product['Product Name']).encode("utf-8"), digest_size=8).digest()
+                if key in seen:
+                    continue
+                seen.add(key)
+                page.append(product)
+                if len(page) == items_per_page:
+                    yield page
+                    page = []
+                    
+        if page:
+            yield page
+        self.log(f"✓ Streamed {rows} rows, {len(seen)} unique products")
+        
+    def generate_grids_streaming(self, csv_path):
+        """Acquire images for one page of products at a time and render it immediately"""
+        import pandas as pd
+        run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_files = []
+        executor = None
+        pending = deque()
+        
+        if self.render_workers > 1:
+            # Cap queued pages so memory stays flat however long the CSV is
+            workers, max_pending, _ = self.parallel_limits()
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_render_worker,
+                                           initargs=(self.render_worker_settings(),))
+        else:
+            fonts = self.load_fonts()
+            
+        incremental = self.incremental and self.page_format != "pdf"
+        manifest = self.load_build_manifest() if incremental else None
+        fingerprint = self.build_fingerprint() if incremental else None
+        page_hashes = {}
+        encoder = self.open_page_encoder(run_stamp)
+        
+        try:
+            for page_number, products in enumerate(self.iter_product_pages(csv_path), start=1):
+                page_df = pd.DataFrame(products)
+                self.process_product_images(page_df)
+                products = self.prepare_products(page_df)
+                self.build_tile_atlas(products)
+                
+                if manifest is not None:
+                    page_hash = self.page_content_hash(products, fingerprint)
+                    page_hashes[page_number] = page_hash
+                    existing = self.manifest_output(manifest, page_number, page_hash)
+                    if existing:
+                        self.log(f"♻ Page {page_number} unchanged, reusing {existing}")
+                        if executor:
+                            # Queue the finished page behind pending renders to keep page order
+                            pending.append([(page_number, existing)])
+                        else:
+                            output_files.extend(self.submit_rendered([(page_number, existing)], encoder))
+                        continue
+                        
+                if executor:
+                    pending.append(executor.submit(_render_page_batch, (run_stamp, [(page_number, products)])))
+                    while len(pending) >= max_pending:
+                        output_files.extend(self._collect_pending(pending.popleft(), encoder))
+                else:
+                    output_files.append(self.create_grid_page(page_number, products, fonts, run_stamp, encoder))
+                    
+            while pending:
+                output_files.extend(self._collect_pending(pending.popleft(), encoder))
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            encoder.close()
+            
+        if manifest is not None:
+            self.save_build_manifest(page_hashes, dict(zip(page_hashes, output_files)))
+        return self.finish_outputs(output_files, encoder)
+        
+    def generate_from_csv(self, csv_path):
+        """Load a CSV, acquire product images and render every grid page; returns the page files"""
+        if self.stream_csv:
+            # Acquire images and render one page at a time
+            self.log(f"\n🎨 Streaming OPTIMIZED Product Grids with LARGE images...")
+            return self.generate_grids_streaming(csv_path)
+            
+        import pandas as pd
+        
+        # Load CSV
+        try:
+            with self.metrics.stage("csv_load"):
+                df = pd.read_csv(csv_path)
+            self.metrics.count("csv_rows", len(df))
+            self.log(f"✓ Loaded {len(df)} products from CSV")
+        except Exception as e:
+            raise Exception(f"Error reading CSV file: {e}")
+            
+        self.validate_columns(df)
+        
+        # Process all images (local + web download)
+        self.process_product_images(df)
+        
+        # Generate grids
+        self.log(f"\n🎨 Generating OPTIMIZED Product Grids with LARGE images...")
+        return self.generate_all_grids(df)
+        
+    def open_job(self, job_path, csv_path=None):
+        """Open a render job, creating its shards from csv_path the first time"""
+        job = RenderJobQueue(job_path)
+        meta = job.meta()
+        if csv_path:
+            digest = hashlib.sha256()
+            with open(csv_path, "rb") as csv_file:
+                for block in iter(lambda: csv_file.read(1024 * 1024), b""):
+                    digest.update(block)
+            if not meta:
+                if self.page_format == "pdf":
+                    job.close()
+                    raise Exception("Render jobs write one file per page; use --format jpeg, jpeg-progressive or webp")
+                self.log(f"🗂 Splitting {csv_path} into page shards")
+                meta = job.create({
+                    'csv_path': os.path.abspath(csv_path),
+                    'csv_sha256': digest.hexdigest(),
+                    'run_stamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+                    'page_format': self.page_format,
+                    # Shards are split by this layout's cells per page, so every worker must render with it
+                    'layout': json.dumps({'dpi': self.layout.dpi, 'columns': self.layout.columns,
+                                          'rows': self.layout.rows, 'page_size': list(self.layout.page_size),
+                                          'draft': self.draft}),
+                    # Pages finished on another day or host must carry the same header
+                    'effective_date': (self.effective_date or datetime.now()).strftime("%Y-%m-%d"),
+                    'store_title': self.store_title,
+                    'store_address': self.store_address,
+                }, enumerate(self.iter_product_pages(csv_path), start=1))
+            if meta['csv_sha256'] != digest.hexdigest():
+                job.close()
+                raise Exception(f"{job_path} was created from a different CSV ({meta['csv_path']})")
+        elif not meta:
+            job.close()
+            raise Exception(f"{job_path} has no shards yet; pass the CSV to create it")
+            
+        # Every worker renders with the job's format, header, layout and file names
+        self.page_format = meta['page_format']
+        self.effective_date = datetime.strptime(meta['effective_date'], "%Y-%m-%d")
+        self.store_title = meta['store_title']
+        self.store_address = meta['store_address']
+        layout = json.loads(meta['layout'])
+        current = (self.layout.dpi, self.layout.columns, self.layout.rows, list(self.layout.page_size), self.draft)
+        if current != (layout['dpi'], layout['columns'], layout['rows'], layout['page_size'], layout['draft']):
+            self.log(f"🗂 Using the job's layout: {layout['columns']}x{layout['rows']} at {layout['dpi']} DPI"
+                     + (" (draft)" if layout['draft'] else ""))
+            self.configure_layout(layout['dpi'], layout['columns'], layout['rows'], layout['page_size'],
+                                  layout['draft'])
+        return job, meta['run_stamp']
+        
+    def work_job_shards(self, job_path, run_stamp):
+        """Claim and render shards until none are left; returns the number rendered here"""
+        import pandas as pd
+        job = RenderJobQueue(job_path)
+        owner = f"{socket.gethostname()}:{os.getpid()}"
+        fonts = self.load_fonts()
+        rendered = 0
+        try:
+            while True:
+                shard = job.claim(owner)
+                if shard is None:
+                    break
+                page_number, products = shard
+                try:
+                    page_df = pd.DataFrame(products)
+                    self.process_product_images(page_df)
+                    output_file = self.create_grid_page(page_number, self.prepare_products(page_df), fonts, run_stamp)
+                except Exception as e:
+                    self.log(f"⚠ Shard {page_number} failed: {e}")
+                    job.release(page_number, str(e))
+                    continue
+                job.complete(page_number, output_file)
+                rendered += 1
+        finally:
+            job.close()
+        return rendered
+        
+    def run_job(self, job_path, csv_path=None):
+        """Render the remaining shards of a job, with render_workers processes; returns the job's page files
+
+        Raises while any shard is failed or still leased elsewhere, so a partial job never reports success.
+        """
+        job, run_stamp = self.open_job(job_path, csv_path)
+        self.log(f"🗂 Job {job_path}: {job.progress()}")
+        
+        if self.render_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.render_workers,
+                                     initializer=_init_render_worker,
+                                     initargs=(self.render_job_settings(),)) as executor:
+                futures = [executor.submit(_work_job_shards, job_path, run_stamp)
+                           for _ in range(self.render_workers)]
+                for future in futures:
+                    _, snapshot = future.result()
+                    self.metrics.merge(snapshot)
+        else:
+            self.work_job_shards(job_path, run_stamp)
+            
+        progress = job.progress()
+        output_files = job.outputs()
+        job.close()
+        self.log(f"🗂 Job {job_path}: {progress}")
+        if progress.get('failed'):
+            raise Exception(f"{progress['failed']} shards failed; see the error column in {job_path}")
+        unfinished = progress.get('pending', 0) + progress.get('claimed', 0)
+        if unfinished:
+            raise Exception(f"{unfinished} shards are still leased by other workers; "
+                            f"run --job {job_path} again once they finish or their leases expire")
+        if self.zip_bundle:
+            self.bundle_job_outputs(output_files, run_stamp)
+        return output_files
+        
+    def render_job_settings(self):
+        """Settings for job worker processes, which also acquire images"""
+        settings = self.render_worker_settings()
+        settings.update({
+            'web_search': self.web_search,
+            'download_workers': self.download_workers,
+            'host_min_interval': self.host_min_interval,
+            'max_retries': self.max_retries,
+            'use_lookup_cache': self.use_lookup_cache,
+            'failure_retry_hours': self.failure_retry_hours,
+            'max_download_bytes': self.max_download_bytes,
+        })
+        return settings
+        
+    def bundle_job_outputs(self, output_files, run_stamp):
+        """Zip a finished job's pages; written to a temporary name first since several workers may finish together"""
+        zip_path = os.path.join(self.output_folder, f"{self.output_prefix()}_{run_stamp}.zip")
+        temp_path = f"{zip_path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as bundle:
+            for output_file in output_files:
+                bundle.write(output_file, os.path.basename(output_file))
+        os.replace(temp_path, zip_path)
+        self.log(f"✓ Wrote bundle -> {zip_path}")
+        
+    def load_store_list(self, stores_path):
+        """Stores from a JSON list of {"name", "csv", "title", "address", "output"}; paths relative to the file"""
+        with open(stores_path, encoding="utf-8") as stores_file:
+            stores = json.load(stores_file)
+        base_folder = os.path.dirname(os.path.abspath(stores_path))
+        for store in stores:
+            if "name" not in store or "csv" not in store:
+                raise Exception(f"Each store in {stores_path} needs a name and a csv")
+            store["csv"] = os.path.join(base_folder, store["csv"])
+            if store.get("output"):
+                store["output"] = os.path.join(base_folder, store["output"])
+        return stores
+        
+    def generate_batch(self, stores):
+        """Render several stores' catalogs, acquiring images for the union of their products once
+
+        Returns {store name: output files}. Each store gets its own output folder
+        (default <output_folder>/<store name>) and its own header title and address.
+        """
+        import pandas as pd
+        
+        catalogs = []
+        for store in stores:
+            try:
+                with self.metrics.stage("csv_load"):
+                    df = pd.read_csv(store["csv"])
+            except Exception as e:
+                raise Exception(f"Error reading CSV file for {store['name']}: {e}")
+            self.validate_columns(df)
+            self.metrics.count("csv_rows", len(df))
+            catalogs.append(df)
+            self.log(f"✓ Loaded {len(df)} products for {store['name']}")
+            
+        # Look up, download or placeholder every distinct product once for all stores
+        union = pd.DataFrame({'Product Name': pd.concat([df['Product Name'] for df in catalogs]).unique()})
+        self.log(f"\n🧺 {len(union)} distinct products across {len(stores)} stores")
+        self.process_product_images(union)
+        found = dict(zip(union['Product Name'], union['Image_Found']))
+        
+        saved = (self.output_folder, self.store_title, self.store_address, self.warm_derivatives)
+        # Stores share products, so keep decoded cell images between them
+        self.warm_derivatives = True
+        results = {}
+        try:
+            for store, df in zip(stores, catalogs):
+                self.output_folder = store.get("output") or os.path.join(
+                    saved[0], self.clean_text_for_filename(store["name"]))
+                os.makedirs(self.output_folder, exist_ok=True)
+                self.store_title = store.get("title", saved[1])
+                self.store_address = store.get("address", saved[2])
+                df['Image_Found'] = df['Product Name'].map(found).astype(bool)
+                # The previous store's header template is never drawn again
+                self._page_templates = {}
+                
+                self.log(f"\n🏪 Rendering {store['name']} -> {self.output_folder}")
+                results[store["name"]] = self.generate_all_grids(df)
+        finally:
+            self.output_folder, self.store_title, self.store_address, self.warm_derivatives = saved
+            self._page_templates = {}
+        return results
+        
+    def _collect_pending(self, item, encoder):
+        """Hand a queued page to the encoder: a render future or an already finished page"""
+        if isinstance(item, list):
+            return self.submit_rendered(item, encoder)
+        rendered, snapshot = item.result()
+        self.metrics.merge(snapshot)
+        return self.submit_rendered(rendered, encoder)
+        
     def run(self):
         """Main execution function"""
         print("=== OPTIMIZED Product Grid Generator ===")
@@ -537,25 +3012,7 @@ class ProductGridGenerator:
             # Select CSV file
             csv_path = self.select_csv_file()
             
-            # Load CSV
-            try:
-                df = pd.read_csv(csv_path)
-                print(f"✓ Loaded {len(df)} products from CSV")
-            except Exception as e:
-                raise Exception(f"Error reading CSV file: {e}")
-            
-            # Validate required columns
-            required_columns = ['Product Name', 'Price']
-            missing_cols = [col for col in required_columns if col not in df.columns]
-            if missing_cols:
-                raise Exception(f"Missing required columns: {missing_cols}")
-            
-            # Process all images (local + web download)
-            self.process_product_images(df)
-            
-            # Generate grids
-            print(f"\n🎨 Generating OPTIMIZED Product Grids with LARGE images...")
-            output_files = self.generate_all_grids(df)
+            output_files = self.generate_from_csv(csv_path)
             
             print(f"\n🎉 Process completed successfully!")
             print(f"✓ Generated {len(output_files)} optimized grid pages with LARGE product images")
@@ -575,7 +3032,219 @@ class ProductGridGenerator:
             
         input("\nPress Enter to exit...")
 
+
+def _init_render_worker(settings):
+    """Build a generator and load fonts once per render worker process"""
+    global _worker_generator, _worker_fonts
+    _worker_generator = ProductGridGenerator()
+    _worker_generator.__dict__.update(settings)
+    # Workers report metrics back with each batch instead of printing them
+    _worker_generator.metrics = RunMetrics()
+    _worker_fonts = _worker_generator.load_fonts()
+
+
+def _render_page_batch(batch):
+    """Render a batch of pages in a worker process; returns ([(page_number, result)], metrics snapshot)
+
+    The result is the saved page file, or the canvas itself in PDF mode so the
+    parent can append pages to the single PDF in order.
+    """
+    run_stamp, pages = batch
+    rendered = []
+    for page_number, products in pages:
+        if _worker_generator.page_format == "pdf":
+            # The canvas is pickled back to the parent, so it cannot come from the reusable pool
+            rendered.append((page_number, _worker_generator.render_grid_page(products, _worker_fonts,
+                                                                             pooled=False)))
+        else:
+            rendered.append((page_number, _worker_generator.create_grid_page(page_number, products,
+                                                                             _worker_fonts, run_stamp)))
+    snapshot = _worker_generator.metrics.snapshot()
+    _worker_generator.metrics.reset()
+    return rendered, snapshot
+
+
+def _work_job_shards(job_path, run_stamp):
+    """Job worker process: render shards until the queue is empty; returns (count, metrics snapshot)"""
+    rendered = _worker_generator.work_job_shards(job_path, run_stamp)
+    return rendered, _worker_generator.metrics.snapshot()
+
+
+def build_arg_parser():
+    """Command-line options for headless runs"""
+    parser = argparse.ArgumentParser(
+        description="Generate printable product grid pages from a CSV (Product Name, Quantity, For, Price).")
+    parser.add_argument("csv", nargs="?",
+                        help="CSV file to render; omit to use the interactive file picker")
+    
+    paths = parser.add_argument_group("paths")
+    paths.add_argument("--project-folder",
+                       help="project folder (default: the current directory in headless runs, "
+                            "the built-in project path in interactive mode)")
+    paths.add_argument("--image-folder", help="product image folder (default: <project-folder>/image)")
+    paths.add_argument("--output-folder", help="output folder (default: <project-folder>/output)")
+    paths.add_argument("--font", help="TrueType/OpenType font (default: first font in the project folder)")
+    
+    layout = parser.add_argument_group("layout")
+    layout.add_argument("--stream", action="store_true",
+                        help="read the CSV in chunks and render each page as soon as it fills")
+    layout.add_argument("--chunk-size", type=int, default=5000, help="CSV rows per chunk in --stream mode")
+    layout.add_argument("--format", choices=sorted(PAGE_FORMATS), default="jpeg",
+                        help="page output format; pdf writes one multi-page file")
+    layout.add_argument("--zip", action="store_true", help="also write a zip bundle of the outputs")
+    layout.add_argument("--incremental", action="store_true",
+                        help="only re-render pages whose content changed since the last build")
+    layout.add_argument("--effective-date", type=lambda value: datetime.strptime(value, "%Y-%m-%d"),
+                        help="first day of the price period, YYYY-MM-DD (default: today)")
+    layout.add_argument("--dpi", type=int,
+                        help=f"render resolution (default {REFERENCE_DPI}, or 72 with --draft)")
+    layout.add_argument("--page-size", choices=sorted(PAGE_SIZES), default="a3", help="paper size")
+    layout.add_argument("--columns", type=int, default=3, help="grid columns per page")
+    layout.add_argument("--rows", type=int, default=4, help="grid rows per page")
+    layout.add_argument("--draft", action="store_true",
+                        help="fast low-resolution proof with the same line breaks and placement as the final pages")
+    
+    concurrency = parser.add_argument_group("concurrency")
+    concurrency.add_argument("--render-workers", type=int, default=1, help="page render processes")
+    concurrency.add_argument("--pages-per-batch", type=int, default=4, help="pages per render task")
+    concurrency.add_argument("--download-workers", type=int, default=4, help="concurrent image downloads")
+    concurrency.add_argument("--host-interval", type=float, default=1.0,
+                             help="minimum seconds between requests to the same host")
+    concurrency.add_argument("--memory-budget-mb", type=int,
+                             help="cap page buffers in flight (about 52 MB per A3 page at 300 DPI)")
+    concurrency.add_argument("--max-retries", type=int, default=3, help="retries for failed HTTP requests")
+    
+    images = parser.add_argument_group("images")
+    images.add_argument("--no-web", action="store_true",
+                        help="never search the web; use placeholders for missing images")
+    images.add_argument("--no-lookup-cache", action="store_true",
+                        help="do not remember web searches, downloads and failed lookups between runs")
+    images.add_argument("--failure-retry-hours", type=float, default=24,
+                        help="hours before a failed lookup is retried (doubles after each failure)")
+    images.add_argument("--max-download-mb", type=float, default=15,
+                        help="skip web images larger than this many megabytes")
+    images.add_argument("--dedupe-images", action="store_true",
+                        help="hash image contents; identical images share one resized copy and one hardlinked file")
+    images.add_argument("--perceptual-dedupe", action="store_true",
+                        help="with --dedupe-images, also share resized copies between near-identical images of the same colours")
+    images.add_argument("--tile-atlas", action="store_true",
+                        help="keep cell-sized images as raw tiles in a memory-mapped atlas for decode-free pasting")
+    images.add_argument("--no-thumbnail-cache", action="store_true", help="disable the thumbnail cache")
+    images.add_argument("--thumbnail-cache-mb", type=int, default=1024,
+                        help="thumbnail cache size cap in MB (1024 holds roughly 5,000 photo cells at 300 DPI); "
+                             "entries are JPEG quality 90, so pages drawn from the cache can differ slightly "
+                             "from an uncached run (use --no-thumbnail-cache for bit-identical output)")
+    
+    service = parser.add_argument_group("render service")
+    service.add_argument("--serve", metavar="[HOST:]PORT",
+                         help="run a local HTTP render service with warm caches instead of rendering once")
+    service.add_argument("--max-queued-jobs", type=int, default=8,
+                         help="uploads beyond this many waiting jobs get 503 responses")
+    service.add_argument("--warm-images", type=int, default=64,
+                         help="decoded cell images the service keeps in memory")
+    
+    stores = parser.add_argument_group("stores")
+    stores.add_argument("--store-title", help="page title (use \\n for a line break; default: Main Street\\nMarket)")
+    stores.add_argument("--store-address", help="address shown in the page header")
+    stores.add_argument("--stores", metavar="STORES_JSON",
+                        help='render several stores: a JSON list of {"name", "csv", "title", "address", "output"}; '
+                             "images are resolved once for all of them")
+    
+    jobs = parser.add_argument_group("resumable jobs")
+    jobs.add_argument("--job", metavar="JOB_FILE",
+                      help="render through a resumable SQLite job file; created from the CSV on first use, "
+                           "then any number of processes or hosts can join with --job alone")
+    
+    diagnostics = parser.add_argument_group("diagnostics")
+    diagnostics.add_argument("--quiet", action="store_true", help="suppress per-product progress output")
+    diagnostics.add_argument("--metrics-report", help="write stage timings and counters as JSON to this file")
+    diagnostics.add_argument("--profile", help="run under cProfile and write the stats to this file")
+    return parser
+    
+    
+def main(argv=None):
+    """Entry point: interactive when no CSV is given, headless otherwise"""
+    args = build_arg_parser().parse_args(argv)
+    interactive = args.csv is None and args.job is None and args.stores is None and not args.serve
+    project_folder = args.project_folder
+    if project_folder is None and not interactive:
+        # Cron and container runs work in the current directory rather than the desktop path
+        project_folder = os.getcwd()
+    generator = ProductGridGenerator(project_folder, args.image_folder, args.output_folder, args.font)
+    generator.stream_csv = args.stream
+    generator.csv_chunk_size = args.chunk_size
+    generator.incremental = args.incremental
+    generator.page_format = args.format
+    generator.zip_bundle = args.zip
+    generator.effective_date = args.effective_date
+    generator.render_workers = args.render_workers
+    generator.pages_per_batch = args.pages_per_batch
+    generator.download_workers = args.download_workers
+    generator.host_min_interval = args.host_interval
+    generator.max_retries = args.max_retries
+    generator.memory_budget_mb = args.memory_budget_mb
+    generator.web_search = not args.no_web
+    generator.use_lookup_cache = not args.no_lookup_cache
+    generator.failure_retry_hours = args.failure_retry_hours
+    generator.max_download_bytes = int(args.max_download_mb * 1024 * 1024)
+    generator.use_thumbnail_cache = not args.no_thumbnail_cache
+    generator.use_tile_atlas = args.tile_atlas
+    generator.dedupe_images = args.dedupe_images or args.perceptual_dedupe
+    generator.perceptual_dedupe = args.perceptual_dedupe
+    generator.configure_layout(args.dpi, args.columns, args.rows, args.page_size, args.draft)
+    if args.store_title:
+        generator.store_title = args.store_title.replace("\\n", "\n")
+    if args.store_address:
+        generator.store_address = args.store_address
+    generator.thumbnail_cache_max_mb = args.thumbnail_cache_mb
+    generator.verbose = not args.quiet
+    
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        try:
+            generator.setup_directories()
+        except Exception as e:
+            print(f"\n❌ Error: {e}", file=sys.stderr)
+            return 1
+        generator.warm_derivatives = True
+        generator.derivative_memory_entries = args.warm_images
+        RenderService(generator, max_queued=args.max_queued_jobs).serve(host or "127.0.0.1", int(port))
+        return 0
+        
+    if interactive:
+        generator.run()
+        return 0
+        
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        
+    try:
+        generator.setup_directories()
+        if args.stores:
+            results = generator.generate_batch(generator.load_store_list(args.stores))
+            output_files = [path for store_files in results.values() for path in store_files]
+        elif args.job:
+            output_files = generator.run_job(args.job, args.csv)
+        else:
+            output_files = generator.generate_from_csv(args.csv)
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.metrics_report:
+            generator.metrics.write_report(args.metrics_report, {"csv": args.csv, "job": args.job,
+                                                                 "stores": args.stores})
+            
+    print(f"\n🎉 Generated {len(output_files)} output files in {generator.output_folder}")
+    return 0
+
+
 # Run the generator
 if __name__ == "__main__":
-    generator = ProductGridGenerator()
-    generator.run()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,155 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_grid_generator import ProductGridGenerator, RenderJobQueue, process_alive
+
+
+def exited_pid():
+    """Id of a process that has already exited"""
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+class RenderJobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "job.sqlite")
+        self.host = socket.gethostname()
+        self.me = f"{self.host}:{os.getpid()}"
+        self.job = self.open_queue()
+        self.job.create({"run_stamp": "20240101_000000"},
+                        [(page, [{"Product Name": f"Product {page}"}]) for page in (1, 2, 3)])
+
+    def tearDown(self):
+        self.job.close()
+        self.folder.cleanup()
+
+    def open_queue(self, **options):
+        return RenderJobQueue(self.path, **options)
+
+    def test_create_keeps_existing_job(self):
+        meta = self.job.create({"run_stamp": "other"}, [(1, [])])
+        self.assertEqual(meta, {"run_stamp": "20240101_000000"})
+        self.assertEqual(self.job.progress(), {"pending": 3})
+
+    def test_claims_lowest_pending_shard_once(self):
+        self.assertEqual(self.job.claim(self.me), (1, [{"Product Name": "Product 1"}]))
+        self.assertEqual(self.job.claim(self.me)[0], 2)
+        self.assertEqual(self.job.progress(), {"claimed": 2, "pending": 1})
+
+    def test_expired_lease_is_claimable(self):
+        self.job.close()
+        self.job = self.open_queue(lease_seconds=-1)
+        self.assertEqual(self.job.claim("otherhost:1")[0], 1)
+        self.assertEqual(self.job.claim(self.me)[0], 1)
+
+    def test_shard_of_dead_local_process_is_reclaimed(self):
+        self.job.claim(f"{self.host}:{exited_pid()}")
+        self.assertEqual(self.job.claim(self.me)[0], 1)
+
+    def test_live_and_remote_leases_are_kept(self):
+        self.job.claim(f"{self.host}:{os.getppid()}")
+        self.job.claim(f"otherhost:{exited_pid()}")
+        self.assertEqual(self.job.claim(self.me)[0], 3)
+        self.assertIsNone(self.job.claim(self.me))
+
+    def test_release_retries_then_fails(self):
+        self.job.close()
+        self.job = self.open_queue(max_attempts=2)
+        self.job.claim(self.me)
+        self.job.release(1, "boom")
+        self.assertEqual(self.job.progress(), {"pending": 3})
+        self.assertEqual(self.job.claim(self.me)[0], 1)
+        self.job.release(1, "boom again")
+        self.assertEqual(self.job.progress(), {"failed": 1, "pending": 2})
+        self.assertEqual(self.job.claim(self.me)[0], 2)
+
+    def test_completed_shards_are_checkpointed(self):
+        for _ in range(3):
+            page_number, _ = self.job.claim(self.me)
+            self.job.complete(page_number, f"page_{page_number}.jpg")
+        self.job.close()
+        # A new connection, as after a restart, sees the finished job
+        self.job = self.open_queue()
+        self.assertEqual(self.job.progress(), {"done": 3})
+        self.assertIsNone(self.job.claim(self.me))
+        self.assertEqual(self.job.outputs(), ["page_1.jpg", "page_2.jpg", "page_3.jpg"])
+
+    def test_process_alive(self):
+        self.assertTrue(process_alive(os.getpid()))
+        self.assertFalse(process_alive(exited_pid()))
+
+
+class RunJobTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.generator = ProductGridGenerator(self.folder.name)
+        self.generator.verbose = False
+        self.generator.web_search = False
+        self.generator.setup_directories()
+        self.csv_path = os.path.join(self.folder.name, "catalog.csv")
+        with open(self.csv_path, "w", encoding="utf-8") as csv_file:
+            csv_file.write("Product Name,Price\n")
+            for number in range(15):
+                csv_file.write(f"Product {number},$1.99\n")
+        self.job_path = os.path.join(self.folder.name, "job.sqlite")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_job_records_and_applies_its_layout(self):
+        self.generator.configure_layout(None, columns=3, rows=4, draft=True)
+        job, _ = self.generator.open_job(self.job_path, self.csv_path)
+        job.close()
+        worker = ProductGridGenerator(self.folder.name)
+        worker.verbose = False
+        worker.configure_layout(None, columns=2, rows=2)
+        job, _ = worker.open_job(self.job_path)
+        job.close()
+        self.assertEqual((worker.layout.columns, worker.layout.rows, worker.layout.dpi, worker.draft),
+                         (3, 4, 72, True))
+
+    def test_job_records_and_applies_its_header(self):
+        self.generator.store_title = "Corner\nStore"
+        self.generator.store_address = "1 Corner Street"
+        job, _ = self.generator.open_job(self.job_path, self.csv_path)
+        job.close()
+        worker = ProductGridGenerator(self.folder.name)
+        worker.verbose = False
+        job, _ = worker.open_job(self.job_path)
+        job.close()
+        self.assertEqual((worker.store_title, worker.store_address), ("Corner\nStore", "1 Corner Street"))
+        self.assertEqual(worker.effective_date.date(), datetime.now().date())
+
+    def test_unfinished_job_does_not_report_success(self):
+        job, _ = self.generator.open_job(self.job_path, self.csv_path)
+        # Another host is still rendering the only shard left
+        job.claim("otherhost:1")
+        job.close()
+        self.generator.configure_layout(None, draft=True)
+        with self.assertRaises(Exception) as raised:
+            self.generator.run_job(self.job_path)
+        self.assertIn("still leased", str(raised.exception))
+        job = RenderJobQueue(self.job_path)
+        self.assertEqual(job.progress(), {"claimed": 1, "done": 1})
+        job.close()
+
+    def test_restart_reclaims_shard_of_crashed_run(self):
+        job, _ = self.generator.open_job(self.job_path, self.csv_path)
+        job.claim(f"{socket.gethostname()}:{exited_pid()}")
+        job.close()
+        output_files = self.generator.run_job(self.job_path)
+        self.assertEqual(len(output_files), 2)
+        self.assertTrue(all(os.path.exists(path) for path in output_files))
+
+
+if __name__ == "__main__":
+    unittest.main()